@@ -6,120 +6,248 @@ import ast
 import argparse
 import subprocess
 import difflib
-import string
 import itertools
 import threading
 import queue
 import time
+import hashlib
+import pickle
+import sqlite3
 
 def fail(msg):
     print(msg, file=sys.stderr)
     sys.exit(1)
 
-try:
-    import attr
-    from colorama import Fore, Style, Back
-    import ansiwrap
-    import watchdog
-except ModuleNotFoundError as e:
+def fail_missing_module(e):
     fail(f"Missing prerequisite python module {e.name}. "
-        "Run `python3 -m pip install --user colorama ansiwrap attrs watchdog` to install prerequisites.")
+        "Run `python3 -m pip install --user colorama ansiwrap watchdog` to install prerequisites.")
 
-# Prefer to use diff_settings.py from the current working directory
-sys.path.insert(0, '.')
-try:
-    import diff_settings
-except ModuleNotFoundError:
-    fail("Unable to find diff_settings.py in the same directory.")
+def import_diff_settings():
+    # Prefer to use diff_settings.py from the current working directory
+    sys.path.insert(0, '.')
+    try:
+        import diff_settings
+    except ModuleNotFoundError:
+        fail("Unable to find diff_settings.py in the same directory.")
+    return diff_settings
+
+import diff_mips
+import diff_myers
 
 # ==== CONFIG ====
 
-parser = argparse.ArgumentParser(
-        description="Diff MIPS assembly.")
-parser.add_argument('start',
-        help="Function name or address to start diffing from.")
-parser.add_argument('end', nargs='?',
-        help="Address to end diff at.")
-parser.add_argument('-o', dest='diff_obj', action='store_true',
-        help="Diff .o files rather than a whole binary. This makes it possible to see symbol names. (Recommended)")
-parser.add_argument('--base-asm', dest='base_asm', metavar='FILE',
-        help="Read assembly from given file instead of configured base img.")
-parser.add_argument('--write-asm', dest='write_asm', metavar='FILE',
-        help="Write the current assembly output to file, e.g. for use with --base-asm.")
-parser.add_argument('-m', '--make', dest='make', action='store_true',
-        help="Automatically run 'make' on the .o file or binary before diffing.")
-parser.add_argument('-l', '--skip-lines', dest='skip_lines', type=int, default=0,
-        help="Skip the first N lines of output.")
-parser.add_argument('-s', '--stop-jr-ra', dest='stop_jrra', action='store_true',
-        help="Stop disassembling at the first 'jr ra'. Some functions have multiple return points, so use with care!")
-parser.add_argument('-i', '--ignore-large-imms', dest='ignore_large_imms', action='store_true',
-        help="Pretend all large enough immediates are the same.")
-parser.add_argument('-B', '--no-show-branches', dest='show_branches', action='store_false',
-        help="Don't visualize branches/branch targets.")
-parser.add_argument('-S', '--base-shift', dest='base_shift', type=str, default='0',
-        help="Diff position X in our img against position X + shift in the base img. "
-        "Arithmetic is allowed, so e.g. |-S \"0x1234 - 0x4321\"| is a reasonable "
-        "flag to pass if it is known that position 0x1234 in the base img syncs "
-        "up with position 0x4321 in our img. Not supported together with -o.")
-parser.add_argument('-w', '--watch', dest='watch', action='store_true',
-        help="Automatically update when source/object files change. "
-        "Recommended in combination with -m.")
-parser.add_argument('--width', dest='column_width', type=int, default=50,
-        help="Sets the width of the left and right view column.")
-
-# Project-specific flags, e.g. different versions/make arguments.
-if hasattr(diff_settings, "add_custom_arguments"):
-    diff_settings.add_custom_arguments(parser)
-
-args = parser.parse_args()
-
-# Set imgs, map file and make flags in a project-specific manner.
-config = {}
-diff_settings.apply(config, args)
-
-baseimg = config.get('baseimg', None)
-myimg = config.get('myimg', None)
-mapfile = config.get('mapfile', None)
-makeflags = config.get('makeflags', [])
-source_directories = config.get('source_directories', None)
+def parse_args():
+    parser = argparse.ArgumentParser(
+            description="Diff MIPS assembly.")
+    parser.add_argument('start', nargs='?',
+            help="Function name or address to start diffing from.")
+    parser.add_argument('end', nargs='?',
+            help="Address to end diff at.")
+    parser.add_argument('-o', dest='diff_obj', action='store_true',
+            help="Diff .o files rather than a whole binary. This makes it possible to see symbol names. (Recommended)")
+    parser.add_argument('--base-asm', dest='base_asm', metavar='FILE',
+            help="Read assembly from given file instead of configured base img.")
+    parser.add_argument('--write-asm', dest='write_asm', metavar='FILE',
+            help="Write the current assembly output to file, e.g. for use with --base-asm.")
+    parser.add_argument('-m', '--make', dest='make', action='store_true',
+            help="Automatically run 'make' on the .o file or binary before diffing.")
+    parser.add_argument('-l', '--skip-lines', dest='skip_lines', type=int, default=0,
+            help="Skip the first N lines of output.")
+    parser.add_argument('-s', '--stop-jr-ra', dest='stop_jrra', action='store_true',
+            help="Stop disassembling at the first 'jr ra'. Some functions have multiple return points, so use with care!")
+    parser.add_argument('-i', '--ignore-large-imms', dest='ignore_large_imms', action='store_true',
+            help="Pretend all large enough immediates are the same.")
+    parser.add_argument('-B', '--no-show-branches', dest='show_branches', action='store_false',
+            help="Don't visualize branches/branch targets.")
+    parser.add_argument('-S', '--base-shift', dest='base_shift', type=str, default='0',
+            help="Diff position X in our img against position X + shift in the base img. "
+            "Arithmetic is allowed, so e.g. |-S \"0x1234 - 0x4321\"| is a reasonable "
+            "flag to pass if it is known that position 0x1234 in the base img syncs "
+            "up with position 0x4321 in our img. Not supported together with -o.")
+    parser.add_argument('-w', '--watch', dest='watch', action='store_true',
+            help="Automatically update when source/object files change. "
+            "Recommended in combination with -m.")
+    parser.add_argument('--width', dest='column_width', type=int, default=50,
+            help="Sets the width of the left and right view column.")
+    parser.add_argument('--less', dest='use_less', action='store_true',
+            help="Page the diff with less rather than the built-in viewer. "
+            "less is always used when not running in a terminal.")
+    parser.add_argument('--algorithm', dest='algorithm', choices=['difflib', 'myers'], default='difflib',
+            help="Diff algorithm. 'myers' is much faster on long functions, "
+            "but may align lines differently.")
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+            help="Don't read or write the cache of processed disassembly.")
+    parser.add_argument('--objdump', dest='use_objdump', action='store_true',
+            help="Disassemble with binutils' objdump rather than the built-in disassembler. "
+            "objdump is also used for files the built-in disassembler can't read.")
+    parser.add_argument('--all', dest='all', metavar='REPORT',
+            help="Diff every function in the map file instead, and write a report of how "
+            "much each one differs to REPORT, as CSV if it ends in .csv and JSON otherwise.")
+    parser.add_argument('--jobs', dest='jobs', type=int, default=os.cpu_count() or 1,
+            help="Number of processes to diff with in --all mode. Defaults to the number of CPUs.")
+
+    # Project-specific flags, e.g. different versions/make arguments.
+    diff_settings = import_diff_settings()
+    if hasattr(diff_settings, "add_custom_arguments"):
+        diff_settings.add_custom_arguments(parser)
+
+    args = parser.parse_args()
+    if args.start is None and args.all is None:
+        parser.error("the following arguments are required: start")
+    return args
+
+# Set by setup().
+args = None
+diff_settings = None
+baseimg = None
+myimg = None
+mapfile = None
+makeflags = []
+source_directories = None
+cache_dir = None
+base_shift = 0
+
+def setup(parsed_args):
+    """
+    Configure the module from parsed arguments. Also the initializer of
+    --all's worker processes.
+    """
+    global args, diff_settings, baseimg, myimg, mapfile, makeflags, source_directories, cache_dir, base_shift
+    args = parsed_args
+    diff_settings = import_diff_settings()
+
+    # Set imgs, map file and make flags in a project-specific manner.
+    config = {}
+    diff_settings.apply(config, args)
+
+    baseimg = config.get('baseimg', None)
+    myimg = config.get('myimg', None)
+    mapfile = config.get('mapfile', None)
+    makeflags = config.get('makeflags', [])
+    source_directories = config.get('source_directories', None)
+    cache_dir = config.get('cache_dir', '.diff_cache')
+    base_shift = eval_int(args.base_shift, "Failed to parse --base-shift (-S) argument as an integer.")
+
+BINUTILS_PREFIXES = ['mips-linux-gnu-', 'mips64-elf-']
 
 MAX_FUNCTION_SIZE_LINES = 1024
 MAX_FUNCTION_SIZE_BYTES = 1024 * 4
 
-COLOR_ROTATION = [
-    Fore.MAGENTA,
-    Fore.CYAN,
-    Fore.GREEN,
-    Fore.RED,
-    Fore.LIGHTYELLOW_EX,
-    Fore.LIGHTMAGENTA_EX,
-    Fore.LIGHTCYAN_EX,
-    Fore.LIGHTGREEN_EX,
-    Fore.LIGHTBLACK_EX,
-]
+# colorama and ansiwrap are only needed to draw a diff, so
+# load_display_modules() imports them on first use.
+Fore = None
+Style = None
+ansiwrap = None
+COLOR_ROTATION = []
 
 BUFFER_CMD = ["tail", "-c", str(10**9)]
 LESS_CMD = ["less", "-Ric"]
+# Keys of the built-in viewer, as the terminal sends them.
+PAGER_KEYS = {
+    'j': 'down', 'e': 'down', '\n': 'down', '\x1b[B': 'down', '\x1bOB': 'down',
+    'k': 'up', 'y': 'up', '\x1b[A': 'up', '\x1bOA': 'up',
+    ' ': 'page_down', 'f': 'page_down', '\x1b[6~': 'page_down',
+    'b': 'page_up', '\x1b[5~': 'page_up',
+    'd': 'half_down', 'u': 'half_up',
+    'g': 'top', '<': 'top', '\x1b[H': 'top', '\x1b[1~': 'top',
+    'G': 'bottom', '>': 'bottom', '\x1b[F': 'bottom', '\x1b[4~': 'bottom',
+    'r': 'redraw', '\x0c': 'redraw',
+    'q': 'quit', 'Q': 'quit',
+}
 
 DEBOUNCE_DELAY = 0.1
+# Processed disassembly is cached by the contents of the disassembled file,
+# evicting the least recently used entries beyond this size.
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Bump when the cached data or process() changes.
+CACHE_VERSION = 5
+# Bump when parse_map_file() changes.
+MAP_INDEX_VERSION = 1
+# Weights of the kinds of differences in the --all report's mismatch score.
+SCORE_INSTRUCTION = 5
+SCORE_IMMEDIATE = 2
+SCORE_REGISTER = 1
 FS_WATCH_EXTENSIONS = ['.c', '.h']
 
 # ==== LOGIC ====
 
+def load_display_modules():
+    global Fore, Style, ansiwrap
+    if Fore is not None:
+        return
+    try:
+        from colorama import Fore, Style
+        import ansiwrap
+    except ModuleNotFoundError as e:
+        fail_missing_module(e)
+    COLOR_ROTATION[:] = [
+        Fore.MAGENTA,
+        Fore.CYAN,
+        Fore.GREEN,
+        Fore.RED,
+        Fore.LIGHTYELLOW_EX,
+        Fore.LIGHTMAGENTA_EX,
+        Fore.LIGHTCYAN_EX,
+        Fore.LIGHTGREEN_EX,
+        Fore.LIGHTBLACK_EX,
+    ]
+
 binutils_prefix = None
 
-for binutils_cand in ['mips-linux-gnu-', 'mips64-elf-']:
+def binutils_state_path():
+    path_hash = hashlib.sha1(os.environ.get('PATH', '').encode()).hexdigest()
+    return os.path.join(cache_dir, 'binutils-' + path_hash)
+
+def get_binutils_prefix():
+    # Only needed when falling back to objdump, so look for it lazily. Finding
+    # it means running objdump, so the result is kept in the cache directory
+    # for the current PATH.
+    global binutils_prefix
+    if binutils_prefix:
+        return binutils_prefix
+    state_path = binutils_state_path()
+    if args.use_cache:
+        try:
+            with open(state_path) as f:
+                prefix = f.read()
+            if prefix in BINUTILS_PREFIXES:
+                binutils_prefix = prefix
+                return binutils_prefix
+        except OSError:
+            pass
+    for binutils_cand in BINUTILS_PREFIXES:
+        try:
+            subprocess.check_call([binutils_cand + "objdump", "--version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            binutils_prefix = binutils_cand
+            break
+        except subprocess.CalledProcessError:
+            pass
+        except FileNotFoundError:
+            pass
+    else:
+        fail("Missing binutils; please ensure mips-linux-gnu-objdump or mips64-elf-objdump exist.")
+    if args.use_cache:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f'{state_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(binutils_prefix)
+            os.replace(tmp_path, state_path)
+        except OSError:
+            pass
+    return binutils_prefix
+
+def call_objdump(objdump_args):
     try:
-        subprocess.check_call([binutils_cand + "objdump", "--version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        binutils_prefix = binutils_cand
-        break
-    except subprocess.CalledProcessError:
-        pass
+        return subprocess.check_output([get_binutils_prefix() + "objdump"] + objdump_args,
+                universal_newlines=True)
     except FileNotFoundError:
-        pass
-
-if not binutils_prefix:
-    fail("Missing binutils; please ensure mips-linux-gnu-objdump or mips64-elf-objdump exist.")
+        # It was uninstalled since its prefix was saved.
+        try:
+            os.remove(binutils_state_path())
+        except OSError:
+            pass
+        fail("Missing binutils; please ensure mips-linux-gnu-objdump or mips64-elf-objdump exist.")
 
 def eval_int(expr, emsg=None):
     try:
@@ -132,11 +260,11 @@ def eval_int(expr, emsg=None):
             fail(emsg)
         return None
 
-def run_make(target, capture_output=False):
+def run_make(*targets, capture_output=False):
     if capture_output:
-        return subprocess.run(["make"] + makeflags + [target], stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+        return subprocess.run(["make"] + makeflags + list(targets), stderr=subprocess.PIPE, stdout=subprocess.PIPE)
     else:
-        subprocess.check_call(["make"] + makeflags + [target])
+        subprocess.check_call(["make"] + makeflags + list(targets))
 
 def restrict_to_function(dump, fn_name):
     out = []
@@ -151,18 +279,215 @@ def restrict_to_function(dump, fn_name):
             found = True
     return '\n'.join(out)
 
+def run_builtin_disassembler(flags, target):
+    if '-bbinary' in flags:
+        start = end = None
+        for flag in flags:
+            if flag.startswith('--start-address='):
+                start = int(flag.split('=')[1])
+            elif flag.startswith('--stop-address='):
+                end = int(flag.split('=')[1])
+        return diff_mips.disassemble_binary(target, start, end)
+    return diff_mips.disassemble_elf(target)
+
+def skip_header(dump):
+    # Drop everything up to the label of a dump that starts at a function.
+    lines = dump.split('\n')
+    for i, line in enumerate(lines):
+        if line.endswith('>:'):
+            return '\n'.join(lines[i + 1:])
+    return ''
+
+def function_address_flags(target, fn_name):
+    # objdump flags that limit it to fn_name, from the object file's symbol
+    # table, or None if the function can't be found there.
+    try:
+        with open(target, 'rb') as f:
+            elf = diff_mips.ElfFile(f.read())
+    except diff_mips.UnsupportedFile:
+        return None
+    found = elf.function_range(fn_name)
+    if found is None:
+        return None
+    index, start, end = found
+    return [f"--section={elf.sections[index].name}",
+            f"--start-address={start}", f"--stop-address={end}"]
+
 def run_objdump(cmd):
+    """
+    Disassemble target, or only the function restrict in it if given. That
+    function is looked up in the symbol table, so that only its own bytes are
+    disassembled; the whole dump is searched for it as a last resort.
+    """
     flags, target, restrict = cmd
-    out = subprocess.check_output([binutils_prefix + "objdump"] + flags + [target], universal_newlines=True)
+    if not args.use_objdump:
+        try:
+            if restrict is None:
+                return run_builtin_disassembler(flags, target)
+            out = diff_mips.disassemble_function(target, restrict)
+            if out is not None:
+                return skip_header(out)
+        except diff_mips.UnsupportedFile:
+            pass
+    if restrict is not None:
+        address_flags = function_address_flags(target, restrict)
+        if address_flags is not None:
+            return skip_header(call_objdump(flags + address_flags + [target]))
+    out = call_objdump(flags + [target])
     if restrict is not None:
         return restrict_to_function(out, restrict)
     return out
 
-base_shift = eval_int(args.base_shift, "Failed to parse --base-shift (-S) argument as an integer.")
+# Content hashes of the files disassembled so far, by path, along with the
+# size and mtime they were taken at. --all needs the ROM's once per function.
+file_hashes = {}
+
+def hash_file(path):
+    st = os.stat(path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    cached = file_hashes.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    file_hashes[path] = (stamp, h.digest())
+    return h.digest()
+
+def cache_key(cmd):
+    flags, target, restrict = cmd
+    h = hashlib.sha1(hash_file(target))
+    # Everything else that goes into the dump or its processing.
+    settings = (CACHE_VERSION, flags, target, restrict, args.use_objdump,
+            args.diff_obj, args.stop_jrra, args.ignore_large_imms)
+    h.update(repr(settings).encode())
+    return h.hexdigest()
+
+def store_in_cache(path, entry):
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        # The cache is only an optimization.
+        return
+    # --all stores many entries, so it trims the cache once at the end.
+    if not args.all:
+        trim_cache()
+
+def trim_cache():
+    try:
+        entries = []
+        for name in os.listdir(cache_dir):
+            # The map index and binutils prefix have their own invalidation.
+            if not name.endswith('.tmp') and not name.startswith(('map-', 'binutils-')):
+                st = os.stat(os.path.join(cache_dir, name))
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= CACHE_MAX_BYTES:
+                break
+            os.remove(os.path.join(cache_dir, name))
+            total -= size
+    except OSError:
+        # The cache is only an optimization.
+        pass
 
-def search_map_file(fn_name):
-    if not mapfile:
-        fail(f"No map file configured; cannot find function {fn_name}.")
+def load_from_cache(path):
+    try:
+        with open(path, 'rb') as f:
+            entry = pickle.load(f)
+        # Mark the entry as recently used.
+        os.utime(path)
+        return entry
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+def dump_and_process(cmd):
+    """
+    Return the disassembly for cmd along with its processed form, skipping
+    both disassembly and process() if the target file is unchanged since an
+    earlier run.
+    """
+    if not args.use_cache:
+        dump = run_objdump(cmd)
+        return dump, process(dump.split('\n'))
+    path = os.path.join(cache_dir, cache_key(cmd))
+    entry = load_from_cache(path)
+    if entry is not None:
+        return entry
+    dump = run_objdump(cmd)
+    entry = (dump, process(dump.split('\n')))
+    store_in_cache(path, entry)
+    return entry
+
+def parse_map_file(lines):
+    """
+    Map every symbol in the map file to a list of (objfile, rom, ram, section)
+    for its definitions.
+    """
+    symbols = {}
+    cur_objfile = None
+    cur_section = None
+    ram_to_rom = None
+    last_line = ''
+    for line in lines:
+        if line.startswith(' .'):
+            cur_section = line.split()[0]
+        if line.startswith(' .text'):
+            cur_objfile = line.split()[3]
+        if 'load address' in line:
+            tokens = last_line.split() + line.split()
+            ram = int(tokens[1], 0)
+            rom = int(tokens[5], 0)
+            ram_to_rom = rom - ram
+        tokens = line.split()
+        if len(tokens) == 2 and cur_objfile is not None and ram_to_rom is not None:
+            try:
+                ram = int(tokens[0], 0)
+            except ValueError:
+                pass
+            else:
+                symbols.setdefault(tokens[1], []).append(
+                        (cur_objfile, ram + ram_to_rom, ram, cur_section))
+        last_line = line
+    return symbols
+
+map_index = None
+
+def open_map_index():
+    """
+    Return an sqlite database of the map file's symbols. It's kept in the
+    cache directory and rebuilt whenever the map file changes, so that lookups
+    don't need to read the map itself.
+    """
+    global map_index
+    if map_index is not None:
+        return map_index
+    try:
+        st = os.stat(mapfile)
+    except OSError:
+        fail(f"Failed to open map file {mapfile} for reading.")
+    map_path = os.path.abspath(mapfile)
+    stamp = repr((MAP_INDEX_VERSION, map_path, st.st_mtime_ns, st.st_size))
+    index_path = os.path.join(cache_dir, 'map-' + hashlib.sha1(map_path.encode()).hexdigest())
+    # sqlite would create a missing index, so only open one that exists.
+    if args.use_cache and os.path.exists(index_path):
+        conn = None
+        try:
+            conn = sqlite3.connect(index_path)
+            row = conn.execute('SELECT stamp FROM meta').fetchone()
+            if row is not None and row[0] == stamp:
+                map_index, conn = conn, None
+                return map_index
+        except sqlite3.Error:
+            pass
+        finally:
+            if conn is not None:
+                conn.close()
 
     try:
         with open(mapfile) as f:
@@ -171,28 +496,42 @@ def search_map_file(fn_name):
         fail(f"Failed to open map file {mapfile} for reading.")
 
     try:
-        cur_objfile = None
-        ram_to_rom = None
-        cands = []
-        last_line = ''
-        for line in lines:
-            if line.startswith(' .text'):
-                cur_objfile = line.split()[3]
-            if 'load address' in line:
-                tokens = last_line.split() + line.split()
-                ram = int(tokens[1], 0)
-                rom = int(tokens[5], 0)
-                ram_to_rom = rom - ram
-            if line.endswith(' ' + fn_name):
-                ram = int(line.split()[0], 0)
-                if cur_objfile is not None and ram_to_rom is not None:
-                    cands.append((cur_objfile, ram + ram_to_rom))
-            last_line = line
+        symbols = parse_map_file(lines)
     except Exception as e:
         import traceback
         traceback.print_exc()
         fail(f"Internal error while parsing map file")
 
+    tmp_path = f'{index_path}.{os.getpid()}.tmp'
+    try:
+        if not args.use_cache:
+            raise OSError
+        os.makedirs(cache_dir, exist_ok=True)
+        conn = sqlite3.connect(tmp_path)
+    except (OSError, sqlite3.Error):
+        # The index is only an optimization.
+        tmp_path = None
+        conn = sqlite3.connect(':memory:')
+    with conn:
+        conn.execute('CREATE TABLE meta (stamp TEXT)')
+        conn.execute('INSERT INTO meta VALUES (?)', (stamp,))
+        conn.execute('CREATE TABLE symbols (name TEXT, objfile TEXT, rom INTEGER, ram INTEGER, section TEXT)')
+        conn.executemany('INSERT INTO symbols VALUES (?, ?, ?, ?, ?)',
+                ((name,) + cand for name, cands in symbols.items() for cand in cands))
+        conn.execute('CREATE INDEX symbols_name ON symbols (name)')
+    if tmp_path is not None:
+        conn.close()
+        os.replace(tmp_path, index_path)
+        conn = sqlite3.connect(index_path)
+    map_index = conn
+    return map_index
+
+def search_map_file(fn_name):
+    if not mapfile:
+        fail(f"No map file configured; cannot find function {fn_name}.")
+
+    cands = open_map_index().execute(
+            'SELECT objfile, rom FROM symbols WHERE name = ?', (fn_name,)).fetchall()
     if len(cands) > 1:
         fail(f"Found multiple occurrences of function {fn_name} in map file.")
     if len(cands) == 1:
@@ -242,15 +581,17 @@ def dump_binary():
         end_addr = eval_int(args.end, "End address must be an integer expression.")
     else:
         end_addr = start_addr + MAX_FUNCTION_SIZE_BYTES
-    objdump_flags = ['-Dz', '-bbinary', '-mmips', '-EB']
-    flags1 = [f"--start-address={start_addr + base_shift}", f"--stop-address={end_addr + base_shift}"]
-    flags2 = [f"--start-address={start_addr}", f"--stop-address={end_addr}"]
     return (
         myimg,
-        (objdump_flags + flags1, baseimg, None),
-        (objdump_flags + flags2, myimg, None)
+        binary_cmd(baseimg, start_addr + base_shift, end_addr + base_shift),
+        binary_cmd(myimg, start_addr, end_addr)
     )
 
+def binary_cmd(img, start_addr, end_addr):
+    objdump_flags = ['-Dz', '-bbinary', '-mmips', '-EB']
+    flags = [f"--start-address={start_addr}", f"--stop-address={end_addr}"]
+    return (objdump_flags + flags, img, None)
+
 # Alignment with ANSI colors is broken, let's fix it.
 def ansi_ljust(s, width):
     needed = width - ansiwrap.ansilen(s)
@@ -259,12 +600,37 @@ def ansi_ljust(s, width):
     else:
         return s
 
-re_int = re.compile(r'[0-9]+')
-re_comments = re.compile(r'<.*?>')
-re_regs = re.compile(r'\b(a[0-3]|t[0-9]|s[0-7]|at|v[01]|f[12]?[0-9]|f3[01]|fp)\b')
-re_sprel = re.compile(r',([1-9][0-9]*|0x[1-9a-f][0-9a-f]*)\(sp\)')
+re_ansi = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+
+def ansi_clip(s, width):
+    # Cut s to width visible characters, keeping its color codes.
+    out = []
+    visible = 0
+    pos = 0
+    for m in itertools.chain(re_ansi.finditer(s), [None]):
+        text = s[pos:m.start() if m else len(s)]
+        if visible + len(text) > width:
+            out.append(text[:width - visible])
+            break
+        out.append(text)
+        visible += len(text)
+        if m is None:
+            break
+        out.append(m.group())
+        pos = m.end()
+    return ''.join(out)
+
+# Instructions are split into these tokens, and the text between them, in a
+# single scan. Immediates of one digit, or stuck to a symbol name, are left
+# alone. sp-relative offsets only count as such when nonzero, which
+# tokenize() checks after converting them to hex.
+re_token = re.compile(
+    r'(?P<comment><.*?>)'
+    r'|(?P<sprel>,(?:0x[0-9a-f]+|[0-9]+)\(sp\))'
+    r'|(?P<reg>\b(?:a[0-3]|t[0-9]|s[0-7]|at|v[01]|f[12]?[0-9]|f3[01]|fp)\b)'
+    r'|(?P<imm>(?<![0-9A-Za-z_])[0-9]{2,}(?![0-9A-Za-z_]))')
+re_sprel_offset = re.compile(r'[1-9][0-9]*|0x[1-9a-f][0-9a-f]*')
 re_large_imm = re.compile(r'-?[1-9][0-9]{2,}|-?0x[0-9a-f]{3,}')
-forbidden = set(string.ascii_letters + '_')
 branch_likely_instructions = set([
     'beql', 'bnel', 'beqzl', 'bnezl', 'bgezl', 'bgtzl', 'blezl', 'bltzl',
     'bc1tl', 'bc1fl'
@@ -274,17 +640,37 @@ branch_instructions = set([
     'bc1t', 'bc1f'
 ] + list(branch_likely_instructions))
 
-def hexify_int(row, pat):
-    full = pat.group(0)
-    if len(full) <= 1:
-        # leave one-digit ints alone
-        return full
-    start, end = pat.span()
-    if start and row[start - 1] in forbidden:
-        return full
-    if end < len(row) and row[end] in forbidden:
-        return full
-    return hex(int(full))
+def tokenize(text, hexify=False):
+    """
+    Split an instruction into (kind, text) pairs, where kind is 'reg', 'sprel',
+    'imm' or 'text' for everything else, dropping <...> comments. With hexify,
+    immediates are converted to hex.
+    """
+    tokens = []
+    pos = 0
+    for m in re_token.finditer(text):
+        start = m.start()
+        if start > pos:
+            tokens.append(('text', text[pos:start]))
+        pos = m.end()
+        kind = m.lastgroup
+        s = m.group()
+        if kind == 'comment':
+            continue
+        if kind == 'imm':
+            if hexify:
+                s = hex(int(s))
+        elif kind == 'sprel':
+            offset = s[1:-4]
+            if hexify and not offset.startswith('0x') and len(offset) > 1:
+                offset = hex(int(offset))
+                s = f',{offset}(sp)'
+            if not re_sprel_offset.fullmatch(offset):
+                kind = 'text'
+        tokens.append((kind, s))
+    if pos < len(text):
+        tokens.append(('text', text[pos:]))
+    return tokens
 
 def parse_relocated_line(line):
     try:
@@ -327,6 +713,7 @@ def process(lines):
     originals = []
     line_nums = []
     branch_targets = []
+    printed_mnemonics = []
     if not args.diff_obj:
         lines = lines[7:]
         if lines and not lines[-1]:
@@ -342,27 +729,27 @@ def process(lines):
             originals[-1] = process_reloc(row, originals[-1])
             continue
 
-        row = re.sub(re_comments, '', row)
-        row = row.rstrip()
         tabs = row.split('\t')
         row = '\t'.join(tabs[2:])
         line_num = tabs[0].strip()
-        row_parts = row.split('\t', 1)
-        mnemonic = row_parts[0].strip()
-        if mnemonic not in branch_instructions:
-            row = re.sub(re_int, lambda s: hexify_int(row, s), row)
-        original = row
+        mnemonic = row.split('\t', 1)[0].strip()
+        tokens = tokenize(row, hexify=mnemonic not in branch_instructions)
+        original = ''.join(s for _, s in tokens).rstrip()
+        # Branches aren't hexified, so these are the operands as printed.
+        row_parts = original.split('\t', 1)
         if skip_next:
             skip_next = False
             row = '<delay-slot>'
             mnemonic = '<delay-slot>'
+        else:
+            row = ''.join('<reg>' if kind == 'reg' else ',addr(sp)' if kind == 'sprel' else s
+                          for kind, s in tokens).rstrip()
         if mnemonic in branch_likely_instructions:
             skip_next = True
-        row = re.sub(re_regs, '<reg>', row)
-        row = re.sub(re_sprel, ',addr(sp)', row)
         if args.ignore_large_imms:
             row = re.sub(re_large_imm, '<imm>', row)
 
+        printed_mnemonics.append(row_parts[0].strip())
         # Replace tabs with spaces
         mnemonics.append(mnemonic)
         diff_rows.append(row)
@@ -382,7 +769,7 @@ def process(lines):
     originals = [original.strip() for original in originals]
     originals = [''.join(f'{o:<8s}' for o in original.split('\t')) for original in originals]
     # return diff_rows, diff_rows, line_nums
-    return mnemonics, diff_rows, originals, line_nums, branch_targets
+    return mnemonics, diff_rows, originals, line_nums, branch_targets, printed_mnemonics
 
 def format_single_line_diff(line1, line2, column_width):
     return f"{ansi_ljust(line1,column_width)}{ansi_ljust(line2,column_width)}"
@@ -402,22 +789,90 @@ class SymbolColorer:
         t = t or s
         return f'{color}{t}{Fore.RESET}'
 
+def color_tokens(original, reg_colorer, sprel_colorer):
+    out = []
+    for kind, s in tokenize(original):
+        if kind == 'reg':
+            s = reg_colorer.color_symbol(s)
+        elif kind == 'sprel':
+            s = sprel_colorer.color_symbol(s)
+        out.append(s)
+    return ''.join(out)
+
 def normalize_large_imms(row):
     if args.ignore_large_imms:
         row = re.sub(re_large_imm, '<imm>', row)
     return row
 
-def do_diff(basedump, mydump):
-    asm_lines1 = basedump.split('\n')
-    asm_lines2 = mydump.split('\n')
-
-    output = []
+def diff_opcodes(mnemonics1, mnemonics2):
+    if args.algorithm == 'myers':
+        return diff_myers.get_opcodes(mnemonics1, mnemonics2)
+    differ: difflib.SequenceMatcher = difflib.SequenceMatcher(a=mnemonics1, b=mnemonics2, autojunk=False)
+    return differ.get_opcodes()
 
+def diff_matching_blocks(mnemonics1, mnemonics2):
+    if args.algorithm == 'myers':
+        return diff_myers.get_matching_blocks(mnemonics1, mnemonics2)
+    differ: difflib.SequenceMatcher = difflib.SequenceMatcher(a=mnemonics1, b=mnemonics2, autojunk=False)
+    # Without the dummy block at the end.
+    return differ.get_matching_blocks()[:-1]
+
+def rediff_opcodes(opcodes, old_mnemonics2, mnemonics1, mnemonics2):
+    """
+    Turn opcodes, the diff of mnemonics1 against old_mnemonics2, into a diff
+    against mnemonics2. Matches outside the lines that changed between the
+    two versions are kept, and only the lines in between are diffed again.
+    """
+    old_len = len(old_mnemonics2)
+    new_len = len(mnemonics2)
+    limit = min(old_len, new_len)
+    prefix = 0
+    while prefix < limit and old_mnemonics2[prefix] == mnemonics2[prefix]:
+        prefix += 1
+    if prefix == old_len == new_len:
+        return opcodes
+    suffix = 0
+    while suffix < limit - prefix and old_mnemonics2[old_len - suffix - 1] == mnemonics2[new_len - suffix - 1]:
+        suffix += 1
+
+    head = []
+    tail = []
+    for (tag, i1, i2, j1, j2) in opcodes:
+        if tag != 'equal':
+            continue
+        if j1 < prefix:
+            head.append((i1, j1, min(j2, prefix) - j1))
+        if j2 > old_len - suffix:
+            start = max(j1, old_len - suffix)
+            tail.append((i1 + start - j1, start + new_len - old_len, j2 - start))
+    if head:
+        i_lo, j_lo, size = head[-1]
+        i_lo += size
+        j_lo += size
+    else:
+        i_lo = j_lo = 0
+    if tail:
+        i_hi, j_hi, _ = tail[0]
+    else:
+        i_hi, j_hi = len(mnemonics1), new_len
+    middle = [(i_lo + i, j_lo + j, size) for (i, j, size) in
+            diff_matching_blocks(mnemonics1[i_lo:i_hi], mnemonics2[j_lo:j_hi])]
+    blocks = diff_myers.merge_blocks(head + middle + tail)
+    return diff_myers.opcodes_from_blocks(blocks, len(mnemonics1), new_len)
+
+def do_diff(base_processed, my_processed, opcodes=None):
+    return list(iter_diff(base_processed, my_processed, opcodes))[args.skip_lines:]
+
+def iter_diff(base_processed, my_processed, opcodes=None):
+    """
+    Yield the rows of the diff one at a time, so that a viewer can format
+    only as many as it shows. Symbol colors are handed out in row order.
+    """
     # TODO: status line?
     # output.append(sha1sum(mydump))
 
-    mnemonics1, asm_lines1, originals1, line_nums1, branch_targets1 = process(asm_lines1)
-    mnemonics2, asm_lines2, originals2, line_nums2, branch_targets2 = process(asm_lines2)
+    mnemonics1, asm_lines1, originals1, line_nums1, branch_targets1, _ = base_processed
+    mnemonics2, asm_lines2, originals2, line_nums2, branch_targets2, _ = my_processed
 
     sc1 = SymbolColorer(0)
     sc2 = SymbolColorer(0)
@@ -435,8 +890,9 @@ def do_diff(basedump, mydump):
                     btset.add(bt + ":")
                     sc.color_symbol(bt + ":")
 
-    differ: difflib.SequenceMatcher = difflib.SequenceMatcher(a=mnemonics1, b=mnemonics2, autojunk=False)
-    for (tag, i1, i2, j1, j2) in differ.get_opcodes():
+    if opcodes is None:
+        opcodes = diff_opcodes(mnemonics1, mnemonics2)
+    for (tag, i1, i2, j1, j2) in opcodes:
         lines1 = asm_lines1[i1:i2]
         lines2 = asm_lines2[j1:j2]
 
@@ -472,12 +928,8 @@ def do_diff(basedump, mydump):
                 else:
                     line_color = Fore.YELLOW
                     line_prefix = 'r'
-                    out1 = f'{Fore.YELLOW}{original1}{Style.RESET_ALL}'
-                    out2 = f'{Fore.YELLOW}{original2}{Style.RESET_ALL}'
-                    out1 = re.sub(re_regs, lambda s: sc1.color_symbol(s.group()), out1)
-                    out2 = re.sub(re_regs, lambda s: sc2.color_symbol(s.group()), out2)
-                    out1 = re.sub(re_sprel, lambda s: sc3.color_symbol(s.group()), out1)
-                    out2 = re.sub(re_sprel, lambda s: sc4.color_symbol(s.group()), out2)
+                    out1 = f'{Fore.YELLOW}{color_tokens(original1, sc1, sc3)}{Style.RESET_ALL}'
+                    out2 = f'{Fore.YELLOW}{color_tokens(original2, sc2, sc4)}{Style.RESET_ALL}'
             elif tag in ['replace', 'equal']:
                 line_prefix = '|'
                 line_color = Fore.BLUE
@@ -514,14 +966,191 @@ def do_diff(basedump, mydump):
 
             out1 =               f"{line_color}{line_num1} {in_arrow1} {out1}{Style.RESET_ALL}{out_arrow1}"
             out2 = f"{line_color}{line_prefix} {line_num2} {in_arrow2} {out2}{Style.RESET_ALL}{out_arrow2}"
-            output.append(format_single_line_diff(out1, out2, args.column_width))
+            yield format_single_line_diff(out1, out2, args.column_width)
+
+def without_regs(original):
+    return ''.join('<reg>' if kind == 'reg' else s for kind, s in tokenize(original))
+
+def score_diff(base_processed, my_processed):
+    """
+    Count the rows that do_diff() would show as different, by kind: inserted,
+    deleted or changed instructions, rows that only differ in registers, and
+    rows that differ in immediates, stack offsets or symbols.
+    """
+    mnemonics1, _, originals1, _, _, printed1 = base_processed
+    mnemonics2, _, originals2, _, _, printed2 = my_processed
+    counts = {'instruction': 0, 'register': 0, 'immediate': 0}
+    for (tag, i1, i2, j1, j2) in diff_opcodes(mnemonics1, mnemonics2):
+        rows1 = zip(originals1[i1:i2], printed1[i1:i2])
+        rows2 = zip(originals2[j1:j2], printed2[j1:j2])
+        for row1, row2 in itertools.zip_longest(rows1, rows2):
+            if row1 is None or row2 is None:
+                counts['instruction'] += 1
+                continue
+            original1 = normalize_large_imms(row1[0])
+            original2 = normalize_large_imms(row2[0])
+            if original1 == original2:
+                continue
+            # Delay slots are diffed as '<delay-slot>', so compare the
+            # mnemonics as printed.
+            if row1[1] != row2[1]:
+                counts['instruction'] += 1
+            elif without_regs(original1) == without_regs(original2):
+                counts['register'] += 1
+            else:
+                counts['immediate'] += 1
+    return counts
+
+def list_batch_functions():
+    """
+    Return the functions in the map file's .text sections, grouped by object
+    file as (objfile, [(name, rom, end)]), in ROM order. Each function ends
+    where the next one in its file begins, or MAX_FUNCTION_SIZE_BYTES after
+    its start if it's the last one.
+    """
+    files = {}
+    for name, objfile, rom in open_map_index().execute(
+            "SELECT name, objfile, rom FROM symbols WHERE section = '.text' ORDER BY rom, rowid"):
+        files.setdefault(objfile, []).append((name, rom))
+    tasks = []
+    for objfile, symbols in files.items():
+        ends = [rom for _, rom in symbols[1:]] + [symbols[-1][1] + MAX_FUNCTION_SIZE_BYTES]
+        tasks.append((objfile, [(name, rom, end) for (name, rom), end in zip(symbols, ends)]))
+    return tasks
+
+def split_functions(dump):
+    # The lines of each function in an `objdump -drz` dump, by name.
+    functions = {}
+    lines = None
+    for line in dump.split('\n'):
+        if line.endswith('>:'):
+            lines = functions.setdefault(line[line.index('<') + 1:-2], [])
+        elif line.startswith('Disassembly of section'):
+            lines = None
+        elif lines is not None:
+            lines.append(line)
+    return functions
+
+def process_functions(cmd):
+    """
+    Disassemble all of cmd's object file at once and return the processed form
+    of each function in it, by name. Like dump_and_process(), this is cached
+    until the file changes.
+    """
+    path = None
+    if args.use_cache:
+        path = os.path.join(cache_dir, 'functions-' + cache_key(cmd))
+        functions = load_from_cache(path)
+        if functions is not None:
+            return functions
+    functions = {name: process(lines)
+            for name, lines in split_functions(run_objdump(cmd)).items()}
+    if path is not None:
+        store_in_cache(path, functions)
+    return functions
+
+def diff_batch_file(task):
+    """
+    Diff the functions of one object file for --all, returning a report row
+    for each. Runs in a worker process.
+    """
+    objfile, functions = task
+    rows = []
+    error = None
+    if args.diff_obj:
+        # Each object file is disassembled once, rather than once per function.
+        refobjfile = "expected/" + objfile
+        try:
+            if not os.path.isfile(objfile):
+                raise FileNotFoundError(f"{objfile} does not exist")
+            if not os.path.isfile(refobjfile):
+                raise FileNotFoundError(f"{refobjfile} does not exist")
+            base_functions = process_functions((["-drz"], refobjfile, None))
+            my_functions = process_functions((["-drz"], objfile, None))
+        except Exception as e:
+            error = str(e)
+
+    for name, rom, end in functions:
+        row = {'function': name, 'file': objfile, 'rom': f'0x{rom:x}', 'instructions': 0,
+                'instruction_diffs': 0, 'register_diffs': 0, 'immediate_diffs': 0,
+                'score': 0, 'error': error}
+        rows.append(row)
+        if error is not None:
+            continue
+        try:
+            if args.diff_obj:
+                if name not in base_functions or name not in my_functions:
+                    raise KeyError(f"{name} is not in both {objfile} and {refobjfile}")
+                base_processed = base_functions[name]
+                my_processed = my_functions[name]
+            else:
+                # The same commands as for a single function, so that both
+                # share the cache.
+                basecmd = binary_cmd(baseimg, rom + base_shift, end + base_shift)
+                mycmd = binary_cmd(myimg, rom, end)
+                _, base_processed = dump_and_process(basecmd)
+                _, my_processed = dump_and_process(mycmd)
+            counts = score_diff(base_processed, my_processed)
+        except Exception as e:
+            row['error'] = str(e)
+            continue
+        row['instructions'] = len(my_processed[0])
+        row['instruction_diffs'] = counts['instruction']
+        row['register_diffs'] = counts['register']
+        row['immediate_diffs'] = counts['immediate']
+        row['score'] = (SCORE_INSTRUCTION * counts['instruction']
+                + SCORE_IMMEDIATE * counts['immediate']
+                + SCORE_REGISTER * counts['register'])
+    return rows
+
+def run_batch(report_path):
+    import concurrent.futures
+    import csv
+    import json
 
-    return output[args.skip_lines:]
+    if not mapfile:
+        fail("No map file configured; cannot list functions.")
+    if args.diff_obj and base_shift:
+        fail("--base-shift not compatible with -o")
+    if not args.diff_obj and (not baseimg or not myimg):
+        fail("Missing myimg/baseimg in config.")
+    tasks = list_batch_functions()
+    if args.make:
+        # As for a single function, -o only needs the object files.
+        if args.diff_obj:
+            run_make(*[objfile for objfile, _ in tasks])
+        else:
+            run_make(myimg)
+    if args.jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs,
+                initializer=setup, initargs=(args,)) as executor:
+            results = list(executor.map(diff_batch_file, tasks))
+    else:
+        results = list(map(diff_batch_file, tasks))
+    rows = [row for file_rows in results for row in file_rows]
+    if args.use_cache:
+        trim_cache()
+
+    with open(report_path, 'w', newline='') as f:
+        if report_path.endswith('.csv'):
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ['function'])
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, f, indent=2)
+            f.write('\n')
+    matching = sum(1 for row in rows if row['score'] == 0 and row['error'] is None)
+    errors = sum(1 for row in rows if row['error'] is not None)
+    print(f"{matching} of {len(rows)} functions match ({errors} could not be diffed). "
+            f"Wrote {report_path}.")
 
 
 def debounced_fs_watch(targets, outq, debounce_delay):
-    import watchdog.events
-    import watchdog.observers
+    try:
+        import watchdog.events
+        import watchdog.observers
+    except ModuleNotFoundError as e:
+        fail_missing_module(e)
 
     class WatchEventHandler(watchdog.events.FileSystemEventHandler):
         def __init__(self, queue, file_targets):
@@ -585,16 +1214,20 @@ def debounced_fs_watch(targets, outq, debounce_delay):
 
 
 class Display():
-    def __init__(self, basedump, mydump):
-        self.basedump = basedump
+    def __init__(self, base_processed, mydump, my_processed):
+        self.base_processed = base_processed
         self.mydump = mydump
+        self.my_processed = my_processed
+        # Kept up to date with rediff_opcodes() as the current side changes,
+        # since the base side never does.
+        self.opcodes = diff_opcodes(base_processed[0], my_processed[0])
         self.emsg = None
 
     def run_less(self):
         if self.emsg is not None:
             output = self.emsg
         else:
-            output = '\n'.join(do_diff(self.basedump, self.mydump))
+            output = '\n'.join(do_diff(self.base_processed, self.my_processed, self.opcodes))
 
         # Pipe the output through 'tail' and only then to less, to ensure the
         # write call doesn't block. ('tail' has to buffer all its input before
@@ -634,13 +1267,8 @@ class Display():
                 os.system("tput reset")
             if ret != 0 and self.pending_update is not None:
                 # killed by program with the intent to refresh
-                msg, error = self.pending_update
+                self.apply_update(*self.pending_update)
                 self.pending_update = None
-                if not error:
-                    self.mydump = msg
-                    self.emsg = None
-                else:
-                    self.emsg = msg
                 proca, procb = self.run_less()
                 self.less_proc = procb
                 self.ready_queue.put(0)
@@ -650,16 +1278,26 @@ class Display():
                 self.ready_queue.put(0)
                 break
 
+    def apply_update(self, msg, error, processed):
+        if not error:
+            self.opcodes = rediff_opcodes(self.opcodes, self.my_processed[0],
+                    self.base_processed[0], processed[0])
+            self.mydump = msg
+            self.my_processed = processed
+            self.emsg = None
+        else:
+            self.emsg = msg
+
     def progress(self, msg):
         # Write message to top-left corner
         sys.stdout.write("\x1b7\x1b[1;1f{}\x1b8".format(msg + " "))
         sys.stdout.flush()
 
-    def update(self, text, error):
+    def update(self, text, error, processed=None):
         if not error and not self.emsg and text == self.mydump:
             self.progress("Unchanged. ")
             return
-        self.pending_update = (text, error)
+        self.pending_update = (text, error, processed)
         if not self.less_proc:
             return
         self.less_proc.kill()
@@ -672,7 +1310,194 @@ class Display():
         self.ready_queue.get()
 
 
+re_escape_key = re.compile(r'\x1b(?:\[[0-9;]*[~A-Za-z]|O.)?')
+
+def pager_keys(data):
+    # Map terminal input to the actions in PAGER_KEYS, dropping unknown keys.
+    pos = 0
+    while pos < len(data):
+        m = re_escape_key.match(data, pos)
+        key = m.group() if m else data[pos]
+        pos += len(key)
+        if key in PAGER_KEYS:
+            yield PAGER_KEYS[key]
+
+def use_builtin_viewer():
+    if args.use_less or not (sys.stdin.isatty() and sys.stdout.isatty()):
+        return False
+    try:
+        import termios
+    except ImportError:
+        return False
+    return True
+
+class PagerDisplay(Display):
+    """
+    Shows the diff in the terminal's alternate screen instead of less,
+    formatting rows only as far down as has been scrolled. Updates in watch
+    mode are redrawn in place, at the same scroll position.
+    """
+    def __init__(self, base_processed, mydump, my_processed):
+        super().__init__(base_processed, mydump, my_processed)
+        # Held by whichever of the viewer and watch threads touches the state.
+        self.lock = threading.Lock()
+        # Written to wake up the viewer, e.g. after an update or a resize.
+        self.wake_read, self.wake_write = os.pipe()
+        self.viewer_thread = None
+        self.top = 0
+        self.status = ''
+        self.clear = False
+        self.quit = False
+        self.reset_rows()
+
+    def reset_rows(self):
+        if self.emsg is not None:
+            self.rows = self.emsg.expandtabs().split('\n')
+            self.row_iter = iter([])
+            self.row_count = len(self.rows)
+            return
+        self.rows = []
+        rows = iter_diff(self.base_processed, self.my_processed, self.opcodes)
+        self.row_iter = itertools.islice(rows, args.skip_lines, None)
+        total = sum(max(i2 - i1, j2 - j1) for (_, i1, i2, j1, j2) in self.opcodes)
+        self.row_count = max(0, total - args.skip_lines)
+
+    def get_rows(self, start, end):
+        self.rows.extend(itertools.islice(self.row_iter, max(0, end - len(self.rows))))
+        return self.rows[start:end]
+
+    def terminal_size(self):
+        try:
+            return os.get_terminal_size(sys.stdout.fileno())
+        except OSError:
+            return os.terminal_size((80, 24))
+
+    def page_height(self):
+        # The last line is the status line.
+        return max(1, self.terminal_size().lines - 1)
+
+    def draw(self):
+        width = self.terminal_size().columns
+        page = self.page_height()
+        self.top = max(0, min(self.top, self.row_count - page))
+        rows = self.get_rows(self.top, self.top + page)
+        lines = [ansi_clip(row, width) + '\x1b[0m\x1b[K' for row in rows]
+        lines += ['\x1b[K'] * (page - len(rows))
+        if rows:
+            position = f"lines {self.top + 1}-{self.top + len(rows)}/{self.row_count}"
+        else:
+            position = "no lines"
+        status = f"{position}  {self.status}"[:width - 1]
+        clear = '\x1b[2J' if self.clear else ''
+        self.clear = False
+        sys.stdout.write(f"{clear}\x1b[H" + '\r\n'.join(lines) + f"\r\n\x1b[7m{status}\x1b[0m\x1b[K")
+        sys.stdout.flush()
+
+    def scroll(self, action):
+        page = self.page_height()
+        last = max(0, self.row_count - page)
+        moves = {'down': 1, 'up': -1, 'page_down': page, 'page_up': -page,
+                'half_down': page // 2, 'half_up': -(page // 2)}
+        if action in moves:
+            self.top = max(0, min(self.top + moves[action], last))
+        elif action == 'top':
+            self.top = 0
+        elif action == 'bottom':
+            self.top = last
+        elif action == 'redraw':
+            self.clear = True
+
+    def wake(self):
+        os.write(self.wake_write, b'x')
+
+    def on_resize(self, signum, frame):
+        self.clear = True
+        self.wake()
+
+    def run_viewer(self):
+        import select
+        import termios
+        import tty
+        stdin = sys.stdin.fileno()
+        old_attrs = termios.tcgetattr(stdin)
+        # Switch to the alternate screen and hide the cursor.
+        sys.stdout.write('\x1b[?1049h\x1b[?25l')
+        try:
+            tty.setcbreak(stdin)
+            while True:
+                with self.lock:
+                    if self.quit:
+                        break
+                    self.draw()
+                readable, _, _ = select.select([stdin, self.wake_read], [], [])
+                if self.wake_read in readable:
+                    os.read(self.wake_read, 4096)
+                if stdin in readable:
+                    data = os.read(stdin, 4096).decode(errors='replace')
+                    with self.lock:
+                        if not data:
+                            self.quit = True
+                        for action in pager_keys(data):
+                            if action == 'quit':
+                                self.quit = True
+                            else:
+                                self.scroll(action)
+        finally:
+            termios.tcsetattr(stdin, termios.TCSADRAIN, old_attrs)
+            sys.stdout.write('\x1b[?25h\x1b[?1049l')
+            sys.stdout.flush()
+
+    def run_sync(self):
+        import signal
+        signal.signal(signal.SIGWINCH, self.on_resize)
+        try:
+            self.run_viewer()
+        except KeyboardInterrupt:
+            pass
+
+    def run_async(self, watch_queue):
+        import signal
+        # Signal handlers can only be set from the main thread.
+        signal.signal(signal.SIGWINCH, self.on_resize)
+        self.watch_queue = watch_queue
+        self.viewer_thread = threading.Thread(target=self.display_thread)
+        self.viewer_thread.start()
+
+    def display_thread(self):
+        try:
+            self.run_viewer()
+        finally:
+            self.watch_queue.put(None)
+
+    def progress(self, msg):
+        with self.lock:
+            self.status = msg
+        self.wake()
+
+    def update(self, text, error, processed=None):
+        with self.lock:
+            if not error and not self.emsg and text == self.mydump:
+                self.status = "Unchanged."
+            else:
+                self.apply_update(text, error, processed)
+                self.status = ''
+                self.reset_rows()
+        self.wake()
+
+    def terminate(self):
+        with self.lock:
+            self.quit = True
+        self.wake()
+        if self.viewer_thread is not None:
+            self.viewer_thread.join()
+
+
 def main():
+    setup(parse_args())
+    if args.all is not None:
+        run_batch(args.all)
+        return
+
     if args.diff_obj:
         make_target, basecmd, mycmd = dump_objfile()
     else:
@@ -687,13 +1512,15 @@ def main():
 
     if args.base_asm is not None:
         with open(args.base_asm) as f:
-            basedump = f.read()
+            base_processed = process(f.read().split('\n'))
     else:
-        basedump = run_objdump(basecmd)
+        _, base_processed = dump_and_process(basecmd)
 
-    mydump = run_objdump(mycmd)
+    mydump, my_processed = dump_and_process(mycmd)
 
-    display = Display(basedump, mydump)
+    load_display_modules()
+    display_class = PagerDisplay if use_builtin_viewer() else Display
+    display = display_class(base_processed, mydump, my_processed)
 
     if not args.watch:
         display.run_sync()
@@ -729,9 +1556,10 @@ def main():
                     if ret.returncode != 0:
                         display.update(ret.stderr.decode() or ret.stdout.decode(), error=True)
                         continue
-                mydump = run_objdump(mycmd)
-                display.update(mydump, error=False)
+                mydump, my_processed = dump_and_process(mycmd)
+                display.update(mydump, error=False, processed=my_processed)
         except KeyboardInterrupt:
             display.terminate()
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+# In-process VR4300 disassembler for diff.py. It reads .o files and ROM images
+# directly and prints the same text as `objdump -drz` and
+# `objdump -Dz -bbinary -mmips -EB`, so that the rest of diff.py can't tell the
+# difference. test_diff_mips.py checks it against objdump's output.
+import bisect
+import struct
+
+SHN_UNDEF = 0
+
+STT_OBJECT  = 1
+STT_FUNC    = 2
+STT_SECTION = 3
+STT_FILE    = 4
+
+STB_LOCAL = 0
+
+SHT_PROGBITS = 1
+SHT_SYMTAB   = 2
+SHT_RELA     = 4
+SHT_REL      = 9
+
+SHF_EXECINSTR = 0x4
+
+RELOC_NAMES = {
+    2: 'R_MIPS_32',
+    4: 'R_MIPS_26',
+    5: 'R_MIPS_HI16',
+    6: 'R_MIPS_LO16',
+    7: 'R_MIPS_GPREL16',
+}
+R_MIPS_26 = 4
+
+GPR_NAMES = [
+    'zero', 'at', 'v0', 'v1', 'a0', 'a1', 'a2', 'a3',
+    't0', 't1', 't2', 't3', 't4', 't5', 't6', 't7',
+    's0', 's1', 's2', 's3', 's4', 's5', 's6', 's7',
+    't8', 't9', 'k0', 'k1', 'gp', 'sp', 's8', 'ra',
+]
+FPR_NAMES = [f'$f{i}' for i in range(32)]
+
+class UnsupportedFile(Exception):
+    pass
+
+class Section:
+    def __init__(self, header, data):
+        self.sh_name, self.sh_type, self.sh_flags, self.sh_addr, self.sh_offset, self.sh_size, self.sh_link, self.sh_info, self.sh_addralign, self.sh_entsize = struct.unpack('>IIIIIIIIII', header)
+        self.data = data[self.sh_offset:self.sh_offset + self.sh_size]
+        self.name = None
+
+class Symbol:
+    def __init__(self, data, strtab):
+        self.st_name, self.st_value, self.st_size, st_info, self.st_other, self.st_shndx = struct.unpack('>IIIBBH', data)
+        self.bind = st_info >> 4
+        self.type = st_info & 15
+        self.name = c_string(strtab, self.st_name)
+
+class Relocation:
+    def __init__(self, data, sh_type):
+        if sh_type == SHT_REL:
+            self.r_offset, r_info = struct.unpack('>II', data)
+        else:
+            self.r_offset, r_info, self.r_addend = struct.unpack('>IIi', data)
+        self.sym_index = r_info >> 8
+        self.rel_type = r_info & 0xff
+
+def c_string(data, offset):
+    return data[offset:data.index(b'\0', offset)].decode('latin1')
+
+class ElfFile:
+    def __init__(self, data):
+        if data[:4] != b'\x7fELF':
+            raise UnsupportedFile("not an ELF file")
+        if data[4] != 1 or data[5] != 2:
+            raise UnsupportedFile("only 32-bit big-endian ELF files are supported")
+        e_shoff, = struct.unpack('>I', data[0x20:0x24])
+        e_shentsize, e_shnum, e_shstrndx = struct.unpack('>HHH', data[0x2e:0x34])
+        self.sections = []
+        for i in range(e_shnum):
+            offset = e_shoff + i * e_shentsize
+            self.sections.append(Section(data[offset:offset + 40], data))
+        shstrtab = self.sections[e_shstrndx].data
+        for section in self.sections:
+            section.name = c_string(shstrtab, section.sh_name)
+
+        self.symbols = []
+        for section in self.sections:
+            if section.sh_type == SHT_SYMTAB:
+                strtab = self.sections[section.sh_link].data
+                for offset in range(0, len(section.data), 16):
+                    self.symbols.append(Symbol(section.data[offset:offset + 16], strtab))
+
+        # Relocations by the index of the section they apply to. RELA sections
+        # are left out; see read_elf().
+        self.relocs = {}
+        for section in self.sections:
+            if section.sh_type == SHT_REL:
+                relocs = self.relocs.setdefault(section.sh_info, [])
+                for offset in range(0, len(section.data), 8):
+                    relocs.append(Relocation(section.data[offset:offset + 8], SHT_REL))
+
+    def reloc_symbol_name(self, reloc):
+        sym = self.symbols[reloc.sym_index]
+        if sym.type == STT_SECTION:
+            return self.sections[sym.st_shndx].name
+        return sym.name
+
+    def function_range(self, name):
+        """
+        Return (section index, start, end) for the named function in an
+        executable section, or None. Symbols without a size end at the next
+        symbol in their section, or at the end of it.
+        """
+        for sym in self.symbols:
+            if sym.name != name or sym.type in (STT_SECTION, STT_FILE):
+                continue
+            if sym.st_shndx == SHN_UNDEF or sym.st_shndx >= len(self.sections):
+                continue
+            section = self.sections[sym.st_shndx]
+            if section.sh_type != SHT_PROGBITS or not section.sh_flags & SHF_EXECINSTR:
+                continue
+            end = sym.st_value + sym.st_size
+            if not sym.st_size:
+                end = min((other.st_value for other in self.symbols
+                        if other.st_shndx == sym.st_shndx and other.st_value > sym.st_value
+                        and other.type not in (STT_SECTION, STT_FILE)), default=section.sh_size)
+            return sym.st_shndx, sym.st_value, min(end, section.sh_size)
+        return None
+
+    def labels(self, section_index):
+        # The symbol objdump would print at each address of a section: FUNCs
+        # before other types, then globals before locals.
+        best = {}
+        for sym in self.symbols:
+            if sym.st_shndx != section_index or not sym.name:
+                continue
+            if sym.type in (STT_SECTION, STT_FILE):
+                continue
+            rank = (sym.type == STT_FUNC, sym.bind != STB_LOCAL)
+            if sym.st_value not in best or rank > best[sym.st_value][0]:
+                best[sym.st_value] = (rank, sym.name)
+        return {addr: name for addr, (rank, name) in best.items()}
+
+def sign_extend_16(value):
+    return value - 0x10000 if value & 0x8000 else value
+
+def decode(word, pc, fmt_addr):
+    """
+    Decode one instruction at address pc into (mnemonic, operands), using the
+    aliases and operand formats of binutils. fmt_addr formats a branch or jump
+    target.
+    """
+    op = word >> 26
+    rs = (word >> 21) & 31
+    rt = (word >> 16) & 31
+    rd = (word >> 11) & 31
+    sa = (word >> 6) & 31
+    funct = word & 63
+    imm = word & 0xffff
+    simm = sign_extend_16(imm)
+    s, t, d = GPR_NAMES[rs], GPR_NAMES[rt], GPR_NAMES[rd]
+    branch = lambda: fmt_addr((pc + 4 + (simm << 2)) & 0xffffffff)
+    mem = f'{simm}({s})'
+
+    if op == 0:
+        if word == 0:
+            return 'nop', ''
+        name = SPECIAL_NAMES.get(funct)
+        if name is None:
+            return None
+        if funct in (0, 2, 3, 56, 58, 59, 60, 62, 63):
+            return name, f'{d},{t},0x{sa:x}'
+        if funct in (4, 6, 7, 20, 22, 23):
+            return name, f'{d},{t},{s}'
+        if funct == 8:
+            return 'jr', s
+        if funct == 9:
+            return ('jalr', s) if rd == 31 else ('jalr', f'{d},{s}')
+        if funct in (12, 13):
+            code = (word >> 6) & 0xfffff
+            if funct == 13:
+                code, low = code >> 10, code & 0x3ff
+                if low:
+                    return name, f'0x{code:x},0x{low:x}'
+            return (name, f'0x{code:x}') if code else (name, '')
+        if funct == 15:
+            return name, ''
+        if funct in (16, 18):
+            return name, d
+        if funct in (17, 19):
+            return name, s
+        if funct in (24, 25, 28, 29):
+            return name, f'{s},{t}'
+        if funct in (26, 27, 30, 31):
+            return name, f'zero,{s},{t}'
+        if rt == 0 and funct in (33, 37, 45):
+            return 'move', f'{d},{s}'
+        if rs == 0 and funct in (34, 35, 46, 47):
+            return {34: 'neg', 35: 'negu', 46: 'dneg', 47: 'dnegu'}[funct], f'{d},{t}'
+        if rt == 0 and funct == 39:
+            return 'not', f'{d},{s}'
+        if 48 <= funct <= 54:
+            code = (word >> 6) & 0x3ff
+            return (name, f'{s},{t},0x{code:x}') if code else (name, f'{s},{t}')
+        return name, f'{d},{s},{t}'
+
+    if op == 1:
+        name = REGIMM_NAMES.get(rt)
+        if name is None:
+            return None
+        if rt == 17 and rs == 0:
+            return 'bal', branch()
+        if rt in (8, 9, 10, 11, 12, 14):
+            return name, f'{s},{simm}'
+        return name, f'{s},{branch()}'
+
+    if op in (2, 3):
+        target = ((pc + 4) & 0xf0000000) | ((word & 0x3ffffff) << 2)
+        return ('j', 'jal')[op - 2], fmt_addr(target)
+
+    if op in (4, 5, 20, 21):
+        name = {4: 'beq', 5: 'bne', 20: 'beql', 21: 'bnel'}[op]
+        if op == 4 and rs == 0 and rt == 0:
+            return 'b', branch()
+        if rt == 0:
+            return name + 'z' if op in (4, 5) else name[:-1] + 'zl', f'{s},{branch()}'
+        return name, f'{s},{t},{branch()}'
+
+    if op in (6, 7, 22, 23):
+        return {6: 'blez', 7: 'bgtz', 22: 'blezl', 23: 'bgtzl'}[op], f'{s},{branch()}'
+
+    if op in (8, 9, 10, 11, 24, 25):
+        if op == 9 and rs == 0:
+            return 'li', f'{t},{simm}'
+        name = {8: 'addi', 9: 'addiu', 10: 'slti', 11: 'sltiu', 24: 'daddi', 25: 'daddiu'}[op]
+        return name, f'{t},{s},{simm}'
+
+    if op in (12, 13, 14):
+        if op == 13 and rs == 0:
+            return 'li', f'{t},0x{imm:x}'
+        return ('andi', 'ori', 'xori')[op - 12], f'{t},{s},0x{imm:x}'
+
+    if op == 15:
+        return 'lui', f'{t},0x{imm:x}'
+
+    if op == 16:
+        if rs in (0, 1, 4, 5):
+            return {0: 'mfc0', 1: 'dmfc0', 4: 'mtc0', 5: 'dmtc0'}[rs], f'{t},${rd}'
+        if rs == 16:
+            name = {1: 'tlbr', 2: 'tlbwi', 6: 'tlbwr', 8: 'tlbp', 24: 'eret'}.get(funct)
+            return (name, '') if name else None
+        return None
+
+    if op == 17:
+        return decode_cop1(word, rs, rt, rd, sa, funct, branch)
+
+    if op in LOAD_STORE_NAMES:
+        name = LOAD_STORE_NAMES[op]
+        if op == 47:
+            return name, f'0x{rt:x},{mem}'
+        if op in (49, 53, 57, 61):
+            return name, f'{FPR_NAMES[rt]},{mem}'
+        return name, f'{t},{mem}'
+
+    return None
+
+def decode_cop1(word, rs, rt, rd, sa, funct, branch):
+    t = GPR_NAMES[rt]
+    if rs in (0, 1, 4, 5):
+        return {0: 'mfc1', 1: 'dmfc1', 4: 'mtc1', 5: 'dmtc1'}[rs], f'{t},{FPR_NAMES[rd]}'
+    if rs in (2, 6):
+        return ('cfc1' if rs == 2 else 'ctc1'), f'{t},${rd}'
+    if rs == 8:
+        return ('bc1f', 'bc1t', 'bc1fl', 'bc1tl')[rt & 3], branch()
+    fmt = {16: 's', 17: 'd', 20: 'w', 21: 'l'}.get(rs)
+    if fmt is None:
+        return None
+    fd, fs, ft = FPR_NAMES[sa], FPR_NAMES[rd], FPR_NAMES[rt]
+    if funct >= 48:
+        return f'c.{FP_CONDITIONS[funct - 48]}.{fmt}', f'{fs},{ft}'
+    name = COP1_NAMES.get(funct)
+    if name is None:
+        return None
+    if funct <= 3:
+        return f'{name}.{fmt}', f'{fd},{fs},{ft}'
+    return f'{name}.{fmt}', f'{fd},{fs}'
+
+SPECIAL_NAMES = {
+    0: 'sll', 2: 'srl', 3: 'sra', 4: 'sllv', 6: 'srlv', 7: 'srav',
+    8: 'jr', 9: 'jalr', 12: 'syscall', 13: 'break', 15: 'sync',
+    16: 'mfhi', 17: 'mthi', 18: 'mflo', 19: 'mtlo',
+    20: 'dsllv', 22: 'dsrlv', 23: 'dsrav',
+    24: 'mult', 25: 'multu', 26: 'div', 27: 'divu',
+    28: 'dmult', 29: 'dmultu', 30: 'ddiv', 31: 'ddivu',
+    32: 'add', 33: 'addu', 34: 'sub', 35: 'subu',
+    36: 'and', 37: 'or', 38: 'xor', 39: 'nor', 42: 'slt', 43: 'sltu',
+    44: 'dadd', 45: 'daddu', 46: 'dsub', 47: 'dsubu',
+    48: 'tge', 49: 'tgeu', 50: 'tlt', 51: 'tltu', 52: 'teq', 54: 'tne',
+    56: 'dsll', 58: 'dsrl', 59: 'dsra', 60: 'dsll32', 62: 'dsrl32', 63: 'dsra32',
+}
+
+REGIMM_NAMES = {
+    0: 'bltz', 1: 'bgez', 2: 'bltzl', 3: 'bgezl',
+    8: 'tgei', 9: 'tgeiu', 10: 'tlti', 11: 'tltiu', 12: 'teqi', 14: 'tnei',
+    16: 'bltzal', 17: 'bgezal', 18: 'bltzall', 19: 'bgezall',
+}
+
+LOAD_STORE_NAMES = {
+    26: 'ldl', 27: 'ldr', 32: 'lb', 33: 'lh', 34: 'lwl', 35: 'lw', 36: 'lbu',
+    37: 'lhu', 38: 'lwr', 39: 'lwu', 40: 'sb', 41: 'sh', 42: 'swl', 43: 'sw',
+    44: 'sdl', 45: 'sdr', 46: 'swr', 47: 'cache', 48: 'll', 49: 'lwc1',
+    52: 'lld', 53: 'ldc1', 55: 'ld', 56: 'sc', 57: 'swc1', 60: 'scd',
+    61: 'sdc1', 63: 'sd',
+}
+
+COP1_NAMES = {
+    0: 'add', 1: 'sub', 2: 'mul', 3: 'div', 4: 'sqrt', 5: 'abs', 6: 'mov',
+    7: 'neg', 8: 'round.l', 9: 'trunc.l', 10: 'ceil.l', 11: 'floor.l',
+    12: 'round.w', 13: 'trunc.w', 14: 'ceil.w', 15: 'floor.w',
+    32: 'cvt.s', 33: 'cvt.d', 36: 'cvt.w', 37: 'cvt.l',
+}
+
+FP_CONDITIONS = [
+    'f', 'un', 'eq', 'ueq', 'olt', 'ult', 'ole', 'ule',
+    'sf', 'ngle', 'seq', 'ngl', 'lt', 'nge', 'le', 'ngt',
+]
+
+def address_width(end):
+    # objdump drops leading zeros of addresses in chunks of 4, keeping at
+    # least one, based on the end address of the section.
+    digits = f'{end:08x}'
+    zeros = len(digits) - len(digits.lstrip('0'))
+    return 8 - ((zeros - 1) & -4 if zeros else 0)
+
+def format_insn(out, width, addr, word, decoded):
+    if decoded is None:
+        text = f'.word\t0x{word:x}'
+    elif decoded[1]:
+        text = f'{decoded[0]}\t{decoded[1]}'
+    else:
+        text = decoded[0]
+    out.append(f'{addr:{width}x}:\t{word:08x} \t{text}')
+
+def disassemble_binary(path, start, end):
+    """Like `objdump -Dz -bbinary -mmips -EB --start-address --stop-address`."""
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        size = f.tell()
+        end = min(end, size)
+        f.seek(start)
+        data = f.read(max(end - start, 0))
+    out = ['', f'{path}:     file format binary', '', '', 'Disassembly of section .data:', '']
+    out.append(f'{start:08x} <.data+0x{start:x}>:' if start else '00000000 <.data>:')
+    width = address_width(size)
+    fmt_addr = lambda addr: f'0x{addr:x}'
+    for offset in range(0, len(data) - 3, 4):
+        word, = struct.unpack('>I', data[offset:offset + 4])
+        addr = start + offset
+        format_insn(out, width, addr, word, decode(word, addr, fmt_addr))
+    return '\n'.join(out) + '\n'
+
+def read_elf(path):
+    with open(path, 'rb') as f:
+        elf = ElfFile(f.read())
+    if any(section.sh_type == SHT_RELA for section in elf.sections):
+        # objdump would print addends, which diff.py can't parse.
+        raise UnsupportedFile("RELA relocations are not supported")
+    return elf
+
+def disassemble_elf(path):
+    """Like `objdump -drz` on a relocatable object file."""
+    elf = read_elf(path)
+    out = ['', f'{path}:     file format elf32-tradbigmips', '']
+    for index, section in enumerate(elf.sections):
+        if section.sh_type != SHT_PROGBITS or not section.sh_flags & SHF_EXECINSTR:
+            continue
+        disassemble_section(elf, index, 0, section.sh_size, out)
+    return '\n'.join(out) + '\n'
+
+def disassemble_function(path, name):
+    """
+    Like `objdump -drz --start-address --stop-address` over the named
+    function in a relocatable object file, or None if there is no such
+    function.
+    """
+    elf = read_elf(path)
+    found = elf.function_range(name)
+    if found is None:
+        return None
+    index, start, end = found
+    out = ['', f'{path}:     file format elf32-tradbigmips', '']
+    disassemble_section(elf, index, start, end, out)
+    return '\n'.join(out) + '\n'
+
+def disassemble_section(elf, index, start, end, out):
+    section = elf.sections[index]
+    labels = elf.labels(index)
+    label_addrs = sorted(labels)
+    relocs = {}
+    for reloc in elf.relocs.get(index, []):
+        if start <= reloc.r_offset < end:
+            relocs.setdefault(reloc.r_offset, []).append(reloc)
+
+    def label(addr):
+        i = bisect.bisect_right(label_addrs, addr)
+        if i == 0:
+            label_addr, name = 0, section.name
+        else:
+            label_addr = label_addrs[i - 1]
+            name = labels[label_addr]
+        if addr == label_addr:
+            return name
+        return f'{name}+0x{addr - label_addr:x}'
+
+    def describe(addr):
+        return f'{addr:x} <{label(addr)}>'
+
+    out += ['', f'Disassembly of section {section.name}:']
+    width = address_width(section.sh_addr + section.sh_size)
+    for addr in range(start, end - 3, 4):
+        if addr in labels or addr == start:
+            # Like objdump, a start between symbols is given relative to the
+            # symbol before it.
+            out += ['', f'{addr:08x} <{label(addr)}>:']
+        word, = struct.unpack('>I', section.data[addr:addr + 4])
+        insn_relocs = relocs.get(addr, [])
+        fmt_addr = describe
+        jump_reloc = next((r for r in insn_relocs if r.rel_type == R_MIPS_26), None)
+        if jump_reloc is not None:
+            # objdump prints jumps relative to the relocation's symbol.
+            sym = elf.symbols[jump_reloc.sym_index]
+            if sym.st_shndx == SHN_UNDEF:
+                sym_name = elf.reloc_symbol_name(jump_reloc)
+                fmt_addr = lambda target: f'{target:x} <{sym_name}>'
+            else:
+                fmt_addr = lambda target: describe(target + sym.st_value)
+        format_insn(out, width, addr, word, decode(word, addr, fmt_addr))
+        for reloc in insn_relocs:
+            name = RELOC_NAMES.get(reloc.rel_type, f'R_MIPS_{reloc.rel_type}')
+            out.append(f'\t\t\t{addr:x}: {name}\t{elf.reloc_symbol_name(reloc)}')
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# Linear-space O(ND) diff (Myers, "An O(ND) Difference Algorithm and Its
+# Variations", 1986) for diff.py. get_opcodes() returns the same kind of
+# opcodes as difflib.SequenceMatcher.get_opcodes(), but never takes quadratic
+# time on long, mostly shuffled sequences.
+#
+# Run this file to compare it with difflib on the largest functions of a ROM.
+import argparse
+import difflib
+import math
+import os
+import random
+import time
+
+# Like git's xdiff, give up on a minimal diff past this many edits, or the
+# square root of the input size if larger. Badly mismatching functions would
+# otherwise take O(N^2).
+MIN_MAX_COST = 64
+
+def middle_snake(a, alo, ahi, b, blo, bhi, max_cost):
+    """
+    Find a point (x, y) on an optimal edit path between a[alo:ahi] and
+    b[blo:bhi], both non-empty, by searching from both ends at once. After
+    max_cost edits, settle for the furthest point reached from the start.
+    Return None if the two have nothing in common.
+    """
+    n = ahi - alo
+    m = bhi - blo
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    v1 = [-1] * (2 * max_d + 2)
+    v2 = [-1] * (2 * max_d + 2)
+    v1[offset + 1] = 0
+    v2[offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    # Diagonals that ran off the edge of the grid are skipped.
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            if k1 == -d or (k1 != d and v1[offset + k1 - 1] < v1[offset + k1 + 1]):
+                x1 = v1[offset + k1 + 1]
+            else:
+                x1 = v1[offset + k1 - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            v1[offset + k1] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = offset + delta - k1
+                if 0 <= k2_offset < len(v2) and v2[k2_offset] != -1:
+                    if x1 >= n - v2[k2_offset]:
+                        return x1, y1
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            if k2 == -d or (k2 != d and v2[offset + k2 - 1] < v2[offset + k2 + 1]):
+                x2 = v2[offset + k2 + 1]
+            else:
+                x2 = v2[offset + k2 - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - x2 - 1] == b[bhi - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[offset + k2] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < len(v1) and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    if x1 >= n - x2:
+                        return x1, x1 - (k1_offset - offset)
+        if d >= max_cost:
+            best = None
+            for k1 in range(-d + k1start, d + 1 - k1end, 2):
+                x1 = v1[offset + k1]
+                if 0 <= x1 <= n and 0 <= x1 - k1 <= m and (best is None or 2 * x1 - k1 > sum(best)):
+                    best = (x1, x1 - k1)
+            if best in (None, (0, 0), (n, m)):
+                return None
+            return best
+    return None
+
+def get_matching_blocks(a, b):
+    """
+    Return (i, j, size) triples of equal runs, a[i:i+size] == b[j:j+size],
+    in increasing order. Unlike difflib, there's no terminating dummy block.
+    """
+    blocks = []
+    # Ranges still to be diffed, and blocks waiting for the ranges before them,
+    # last one first, so that blocks come out in order without recursing.
+    stack = [('diff', 0, len(a), 0, len(b))]
+    max_cost = max(MIN_MAX_COST, math.isqrt(len(a) + len(b)))
+    while stack:
+        item = stack.pop()
+        if item[0] == 'block':
+            blocks.append(item[1:])
+            continue
+        _, alo, ahi, blo, bhi = item
+        prefix = 0
+        while alo + prefix < ahi and blo + prefix < bhi and a[alo + prefix] == b[blo + prefix]:
+            prefix += 1
+        if prefix:
+            blocks.append((alo, blo, prefix))
+            alo += prefix
+            blo += prefix
+        suffix = 0
+        while alo < ahi - suffix and blo < bhi - suffix and a[ahi - suffix - 1] == b[bhi - suffix - 1]:
+            suffix += 1
+        if suffix:
+            ahi -= suffix
+            bhi -= suffix
+            stack.append(('block', ahi, bhi, suffix))
+        if alo < ahi and blo < bhi:
+            snake = middle_snake(a, alo, ahi, b, blo, bhi, max_cost)
+            if snake is not None:
+                x, y = snake
+                stack.append(('diff', alo + x, ahi, blo + y, bhi))
+                stack.append(('diff', alo, alo + x, blo, blo + y))
+    return merge_blocks(blocks)
+
+def merge_blocks(blocks):
+    merged = []
+    for i, j, size in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + size)
+        else:
+            merged.append((i, j, size))
+    return merged
+
+def get_opcodes(a, b):
+    """Like difflib.SequenceMatcher(a=a, b=b, autojunk=False).get_opcodes()."""
+    return opcodes_from_blocks(get_matching_blocks(a, b), len(a), len(b))
+
+def opcodes_from_blocks(blocks, len_a, len_b):
+    # Fill in the gaps between matching blocks with the edits between them.
+    opcodes = []
+    i = j = 0
+    for ai, bj, size in blocks + [(len_a, len_b, 0)]:
+        if i < ai and j < bj:
+            opcodes.append(('replace', i, ai, j, bj))
+        elif i < ai:
+            opcodes.append(('delete', i, ai, j, bj))
+        elif j < bj:
+            opcodes.append(('insert', i, ai, j, bj))
+        if size:
+            opcodes.append(('equal', ai, ai + size, bj, bj + size))
+        i, j = ai + size, bj + size
+    return opcodes
+
+def check_opcodes(a, b, opcodes):
+    # Applying the opcodes to a must give b.
+    out = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            assert a[i1:i2] == b[j1:j2]
+            out += a[i1:i2]
+        else:
+            out += b[j1:j2]
+    assert out == b
+
+def edit_count(opcodes):
+    return sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in opcodes if tag != 'equal')
+
+def read_functions(mapfile):
+    # (name, rom, size) for the symbols in .text sections, sized by the next
+    # symbol's address. diff.py imports this module, so import it lazily.
+    from diff import parse_map_file
+    with open(mapfile) as f:
+        symbols = parse_map_file(f)
+    starts = sorted((rom, name)
+            for name, definitions in symbols.items()
+            for objfile, rom, ram, section in definitions if section == '.text')
+    return [(name, rom, next_rom - rom)
+            for (rom, name), (next_rom, _) in zip(starts, starts[1:])]
+
+def read_mnemonics(path, start, size):
+    import diff_mips
+    dump = diff_mips.disassemble_binary(path, start, start + size)
+    return [line.split('\t')[2] for line in dump.split('\n')[7:] if line]
+
+def benchmark(name, a, b):
+    timings = []
+    for get in (lambda: difflib.SequenceMatcher(a=a, b=b, autojunk=False).get_opcodes(),
+                lambda: get_opcodes(a, b)):
+        start = time.perf_counter()
+        opcodes = get()
+        timings.append(time.perf_counter() - start)
+        check_opcodes(a, b, opcodes)
+    print(f"{name:40s} {len(a):6d} {len(b):6d} {timings[0]*1000:10.2f} {timings[1]*1000:10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Compare difflib and the Myers diff on the largest functions in the ROM.")
+    parser.add_argument('--map', default='build/us/sm64.us.map')
+    parser.add_argument('--base', default='baserom.us.z64')
+    parser.add_argument('--rom', default='build/us/sm64.us.z64')
+    parser.add_argument('-n', dest='count', type=int, default=10,
+            help="Number of functions to diff.")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'function':40s} {'len a':>6s} {'len b':>6s} {'difflib ms':>10s} {'myers ms':>10s}")
+    if all(os.path.isfile(path) for path in (args.map, args.base, args.rom)):
+        functions = sorted(read_functions(args.map), key=lambda f: -f[2])[:args.count]
+        for name, rom, size in functions:
+            a = read_mnemonics(args.base, rom, size)
+            b = read_mnemonics(args.rom, rom, size)
+            benchmark(name, a, b)
+            # Stand-in for a badly mismatching function: same instructions,
+            # mostly shuffled.
+            shuffled = list(b)
+            rng.shuffle(shuffled)
+            benchmark(name + ' (shuffled)', a, shuffled)
+    else:
+        print(f"({args.map}, {args.base} or {args.rom} missing; using random mnemonics)")
+        alphabet = ['lw', 'sw', 'addiu', 'lui', 'jal', 'nop', 'beqz', 'move', 'or', 'sll']
+        for size in (256, 1024, 4096):
+            a = [rng.choice(alphabet) for _ in range(size)]
+            b = list(a)
+            for _ in range(size // 20):
+                b[rng.randrange(size)] = rng.choice(alphabet)
+            benchmark(f'random {size}, 5% changed', a, b)
+            shuffled = list(a)
+            rng.shuffle(shuffled)
+            benchmark(f'random {size}, shuffled', a, shuffled)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# Measure how long diff.py takes to start up. Run it from the directory with
+# diff_settings.py, optionally with the arguments of a real diff.py run, e.g.
+#
+#   ./diff_startup_benchmark.py -- -o func_80246000
+#
+# Output is discarded, so less exits as soon as it has read it.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DIFF_PY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'diff.py')
+
+def time_runs(cmd, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Measure the startup time of diff.py.")
+    parser.add_argument('-n', dest='runs', type=int, default=20,
+            help="Number of runs of each command.")
+    parser.add_argument('diff_args', nargs=argparse.REMAINDER,
+            help="Arguments for a full diff.py run, after --.")
+    args = parser.parse_args()
+    diff_args = [arg for arg in args.diff_args if arg != '--']
+
+    commands = [
+        ('python3 (interpreter only)', [sys.executable, '-c', 'pass']),
+        ('diff.py --help', [sys.executable, DIFF_PY, '--help']),
+    ]
+    if diff_args:
+        commands.append(('diff.py ' + ' '.join(diff_args), [sys.executable, DIFF_PY] + diff_args))
+
+    print(f"{'command':40s} {'min ms':>8s} {'median ms':>10s}")
+    for name, cmd in commands:
+        timings = time_runs(cmd, args.runs)
+        print(f"{name:40s} {min(timings)*1000:8.1f} {statistics.median(timings)*1000:10.1f}")
+
+if __name__ == '__main__':
+    main()
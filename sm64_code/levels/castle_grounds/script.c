@@ -35,7 +35,6 @@ const LevelScript level_castle_grounds_entry[] = {
     #include "levels/castle_grounds/script.inc.c" 
 
 	FREE_LEVEL_POOL(),
-    MARIO_POS(0x01, 0, 0, 162, 0),
     CALL(/*arg*/ 0, /*func*/ lvl_init_or_update),
     CALL_LOOP(/*arg*/ 1, /*func*/ lvl_init_or_update),
     CLEAR_LEVEL(),
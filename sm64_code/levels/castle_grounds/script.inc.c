@@ -22,3 +22,4 @@
         SET_BACKGROUND_MUSIC(0x00, SEQ_LEVEL_GRASS),
         TERRAIN_TYPE(TERRAIN_GRASS),
     END_AREA(),
+    MARIO_POS(0x01, 0, 0, 162, 0),
@@ -1,18 +1,33 @@
 // wdw_water_level.c.inc
 
+// Number of water boxes in the current area whose levels can be changed.
+// gEnvironmentRegions holds a count followed by 6 shorts per box, the last of
+// which is the box's water level.
+static s32 changing_water_level_count(void) {
+    if (gEnvironmentRegions[0] > ARRAY_COUNT(gEnvironmentLevels))
+        return ARRAY_COUNT(gEnvironmentLevels);
+    return gEnvironmentRegions[0];
+}
+
 // called when WDW is loaded.
 void bhv_init_changing_water_level_loop(void) {
+    s32 i;
+
     if (gCurrentObject->oAction == 0) {
         if (gEnvironmentRegions != NULL)
             gCurrentObject->oAction++;
-    } else if (gCurrentObject->oTimer < 10)
-        *gEnvironmentLevels = gEnvironmentRegions[6];
-    else {
-        gEnvironmentRegions[6] = *gEnvironmentLevels + sins(o->oWaterLevelTriggerUnkF4) * 20.0f;
+    } else if (gCurrentObject->oTimer < 10) {
+        for (i = 0; i < changing_water_level_count(); i++)
+            gEnvironmentLevels[i] = gEnvironmentRegions[6 + 6 * i];
+    } else {
+        for (i = 0; i < changing_water_level_count(); i++)
+            gEnvironmentRegions[6 + 6 * i] = gEnvironmentLevels[i] + sins(o->oWaterLevelTriggerUnkF4) * 20.0f;
         gCurrentObject->oWaterLevelTriggerUnkF4 += 0x200;
     }
 }
 
+// The second byte of the behavior param picks the water box (in collision
+// order) whose level the diamond sets, so several doors can share an area.
 void bhv_water_level_diamond_loop(void) {
     // if (gEnvironmentRegions != NULL) {
         switch (o->oAction) {
@@ -32,9 +47,9 @@ void bhv_water_level_diamond_loop(void) {
                 break;
             case WATER_LEVEL_DIAMOND_ACT_CHANGE_WATER_LEVEL:
                 o->oAngleVelYaw = 0;
-                *gEnvironmentLevels = (s32) approach_f32_symmetric(
-                    (f32) *gEnvironmentLevels, (f32) o->oWaterLevelTriggerTargetWaterLevel, 10.0f);
-                if (*gEnvironmentLevels == o->oWaterLevelTriggerTargetWaterLevel) {
+                gEnvironmentLevels[o->oBehParams2ndByte] = (s32) approach_f32_symmetric(
+                    (f32) gEnvironmentLevels[o->oBehParams2ndByte], (f32) o->oWaterLevelTriggerTargetWaterLevel, 10.0f);
+                if (gEnvironmentLevels[o->oBehParams2ndByte] == o->oWaterLevelTriggerTargetWaterLevel) {
                     if ((s16) o->oFaceAngleYaw == 0)
                         o->oAction++; // Sets to WATER_LEVEL_DIAMOND_ACT_IDLE_SPINNING
                     else
@@ -43,7 +58,7 @@ void bhv_water_level_diamond_loop(void) {
                     if (o->oTimer == 0)
                         cur_obj_play_sound_2(SOUND_GENERAL_WATER_LEVEL_TRIG);
                     else {
-                        if (*gEnvironmentLevels > o->oWaterLevelTriggerTargetWaterLevel)
+                        if (gEnvironmentLevels[o->oBehParams2ndByte] > o->oWaterLevelTriggerTargetWaterLevel)
                             cur_obj_play_sound_1(SOUND_ENV_WATER_DRAIN);
                         else
                             cur_obj_play_sound_1(SOUND_ENV_WATER_DRAIN); // same as above
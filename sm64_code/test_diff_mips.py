@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# Golden tests for diff_mips: the expected text is what binutils'
+# `mips-linux-gnu-objdump` prints for the same input.
+import struct
+
+import pytest
+
+import diff_mips
+
+# (word, disassembly at address 0x10 of a raw binary)
+INSTRUCTIONS = [
+    (0x00000000, 'nop'),
+    (0x27bdffe8, 'addiu\tsp,sp,-24'),
+    (0xafbf0014, 'sw\tra,20(sp)'),
+    (0x8fbf0014, 'lw\tra,20(sp)'),
+    (0xa3a00010, 'sb\tzero,16(sp)'),
+    (0x9082000c, 'lbu\tv0,12(a0)'),
+    (0x03e00008, 'jr\tra'),
+    (0x0320f809, 'jalr\tt9'),
+    (0x0c0d8e4c, 'jal\t0x363930'),
+    (0x00801025, 'move\tv0,a0'),
+    (0x24020001, 'li\tv0,1'),
+    (0x240effff, 'li\tt6,-1'),
+    (0x34018000, 'li\tat,0x8000'),
+    (0x3c018034, 'lui\tat,0x8034'),
+    (0x01cf1021, 'addu\tv0,t6,t7'),
+    (0x00041823, 'negu\tv1,a0'),
+    (0x00a4082a, 'slt\tat,a1,a0'),
+    (0x00031080, 'sll\tv0,v1,0x2'),
+    (0x000f7c03, 'sra\tt7,t7,0x10'),
+    (0x00850018, 'mult\ta0,a1'),
+    (0x0082001a, 'div\tzero,a0,v0'),
+    (0x00001012, 'mflo\tv0'),
+    (0x00001810, 'mfhi\tv1'),
+    (0x0000000d, 'break'),
+    (0x1040000a, 'beqz\tv0,0x3c'),
+    (0x14400003, 'bnez\tv0,0x20'),
+    (0x10000003, 'b\t0x20'),
+    (0x04410002, 'bgez\tv0,0x1c'),
+    (0x45010003, 'bc1t\t0x20'),
+    (0x44802000, 'mtc1\tzero,$f4'),
+    (0x44022000, 'mfc1\tv0,$f4'),
+    (0x4442f800, 'cfc1\tv0,$31'),
+    (0x44c2f800, 'ctc1\tv0,$31'),
+    (0xc7a40018, 'lwc1\t$f4,24(sp)'),
+    (0x46062100, 'add.s\t$f4,$f4,$f6'),
+    (0x46001006, 'mov.s\t$f0,$f2'),
+    (0x4600210d, 'trunc.w.s\t$f4,$f4'),
+    (0x460020a1, 'cvt.d.s\t$f2,$f4'),
+    (0x46802020, 'cvt.s.w\t$f0,$f4'),
+    (0x4606203c, 'c.lt.s\t$f4,$f6'),
+]
+
+@pytest.mark.parametrize('word,expected', INSTRUCTIONS)
+def test_decode(word, expected):
+    mnemonic, operands = diff_mips.decode(word, 0x10, lambda addr: f'0x{addr:x}')
+    assert '\t'.join(filter(None, [mnemonic, operands])) == expected
+
+def test_binary(tmp_path):
+    path = tmp_path / 'rom.bin'
+    path.write_bytes(struct.pack('>5I', 0x27bdffe8, 0xafbf0014, 0x1040000a, 0x00000000, 0x03e00008))
+    assert diff_mips.disassemble_binary(str(path), 4, 0x14) == f'''
+{path}:     file format binary
+
+
+Disassembly of section .data:
+
+00000004 <.data+0x4>:
+   4:\tafbf0014 \tsw\tra,20(sp)
+   8:\t1040000a \tbeqz\tv0,0x34
+   c:\t00000000 \tnop
+  10:\t03e00008 \tjr\tra
+'''
+
+R_MIPS_26 = 4
+R_MIPS_HI16 = 5
+R_MIPS_LO16 = 6
+
+def make_object(words, symbols, relocs):
+    """
+    A big-endian relocatable MIPS ELF with a .text of `words` and REL
+    relocations for it. `symbols` are (name, value, size, type, bind, shndx)
+    and `relocs` are (offset, type, symbol index), counting from 1 since
+    symbol 0 is the null symbol.
+    """
+    text = b''.join(struct.pack('>I', word) for word in words)
+    strtab = b'\0'
+    symtab = b'\0' * 16
+    for name, value, size, sym_type, bind, shndx in symbols:
+        symtab += struct.pack('>IIIBBH', len(strtab), value, size, bind << 4 | sym_type, 0, shndx)
+        strtab += name.encode() + b'\0'
+    rel = b''.join(struct.pack('>II', offset, index << 8 | rel_type) for offset, rel_type, index in relocs)
+    shstrtab = b'\0.text\0.symtab\0.strtab\0.rel.text\0.shstrtab\0'
+    first_global = 1 + sum(1 for symbol in symbols if symbol[4] == diff_mips.STB_LOCAL)
+    # (name, type, flags, data, link, info, addralign, entsize)
+    sections = [
+        ('.text', diff_mips.SHT_PROGBITS, 0x6, text, 0, 0, 16, 0),
+        ('.symtab', diff_mips.SHT_SYMTAB, 0, symtab, 3, first_global, 4, 16),
+        ('.strtab', 3, 0, strtab, 0, 0, 1, 0),
+        ('.rel.text', diff_mips.SHT_REL, 0, rel, 2, 1, 4, 8),
+        ('.shstrtab', 3, 0, shstrtab, 0, 0, 1, 0),
+    ]
+    body = b''
+    headers = b'\0' * 40
+    for name, sh_type, flags, data, link, info, align, entsize in sections:
+        name_offset = shstrtab.index(name.encode() + b'\0')
+        headers += struct.pack('>10I', name_offset, sh_type, flags, 0, 52 + len(body), len(data),
+                link, info, align, entsize)
+        body += data
+    header = b'\x7fELF\x01\x02\x01' + b'\0' * 9
+    header += struct.pack('>HHIIIIIHHHHHH', 1, 8, 1, 0, 0, 52 + len(body), 0, 52, 0, 0, 40,
+            len(sections) + 1, len(sections))
+    return header + body + headers
+
+# foo loads gFoo, calls the undefined bar and the static baz (through the
+# section symbol, like gas does for local functions) and returns.
+FOO_WORDS = [
+    0x27bdffe8, 0xafbf0014, 0x3c010000, 0x8c2e0000,
+    0x11c00003, 0x00000000, 0x0c000000, 0x00000000,
+    0x0c00000e, 0x00000000, 0x8fbf0014, 0x27bd0018,
+    0x03e00008, 0x00000000, 0x03e00008, 0x00000000,
+]
+FOO_SYMBOLS = [
+    ('', 0, 0, diff_mips.STT_SECTION, diff_mips.STB_LOCAL, 1),
+    ('baz', 0x38, 8, diff_mips.STT_FUNC, diff_mips.STB_LOCAL, 1),
+    ('foo', 0, 0x38, diff_mips.STT_FUNC, 1, 1),
+    ('bar', 0, 0, 0, 1, diff_mips.SHN_UNDEF),
+    ('gFoo', 0, 0, 0, 1, diff_mips.SHN_UNDEF),
+]
+FOO_RELOCS = [
+    (0x08, R_MIPS_HI16, 5),
+    (0x0c, R_MIPS_LO16, 5),
+    (0x18, R_MIPS_26, 4),
+    (0x20, R_MIPS_26, 1),
+]
+
+@pytest.fixture
+def foo_object(tmp_path):
+    path = tmp_path / 'foo.o'
+    path.write_bytes(make_object(FOO_WORDS, FOO_SYMBOLS, FOO_RELOCS))
+    return str(path)
+
+def test_elf(foo_object):
+    assert diff_mips.disassemble_elf(foo_object) == f'''
+{foo_object}:     file format elf32-tradbigmips
+
+
+Disassembly of section .text:
+
+00000000 <foo>:
+   0:\t27bdffe8 \taddiu\tsp,sp,-24
+   4:\tafbf0014 \tsw\tra,20(sp)
+   8:\t3c010000 \tlui\tat,0x0
+\t\t\t8: R_MIPS_HI16\tgFoo
+   c:\t8c2e0000 \tlw\tt6,0(at)
+\t\t\tc: R_MIPS_LO16\tgFoo
+  10:\t11c00003 \tbeqz\tt6,20 <foo+0x20>
+  14:\t00000000 \tnop
+  18:\t0c000000 \tjal\t0 <bar>
+\t\t\t18: R_MIPS_26\tbar
+  1c:\t00000000 \tnop
+  20:\t0c00000e \tjal\t38 <baz>
+\t\t\t20: R_MIPS_26\t.text
+  24:\t00000000 \tnop
+  28:\t8fbf0014 \tlw\tra,20(sp)
+  2c:\t27bd0018 \taddiu\tsp,sp,24
+  30:\t03e00008 \tjr\tra
+  34:\t00000000 \tnop
+
+00000038 <baz>:
+  38:\t03e00008 \tjr\tra
+  3c:\t00000000 \tnop
+'''
+
+def test_function(foo_object):
+    assert diff_mips.disassemble_function(foo_object, 'baz') == f'''
+{foo_object}:     file format elf32-tradbigmips
+
+
+Disassembly of section .text:
+
+00000038 <baz>:
+  38:\t03e00008 \tjr\tra
+  3c:\t00000000 \tnop
+'''
+    assert diff_mips.disassemble_function(foo_object, 'qux') is None
+
+def test_rela_is_unsupported(tmp_path):
+    data = bytearray(make_object(FOO_WORDS, FOO_SYMBOLS, FOO_RELOCS))
+    # Turn .rel.text into .rela.text, whose entries objdump prints with addends.
+    section_headers, = struct.unpack_from('>I', data, 32)
+    struct.pack_into('>I', data, section_headers + 4 * 40 + 4, diff_mips.SHT_RELA)
+    path = tmp_path / 'rela.o'
+    path.write_bytes(data)
+    with pytest.raises(diff_mips.UnsupportedFile):
+        diff_mips.read_elf(str(path))
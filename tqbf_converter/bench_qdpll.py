@@ -0,0 +1,44 @@
+#! /usr/bin/env python3.8
+import argparse
+import random
+import time
+
+from parse_qbf import QBF, get_random_3cnf
+from qdpll import solve_qbf
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the QDPLL solver on random 3-CNF QBF instances."
+    )
+    parser.add_argument(
+        "--quantifiers",
+        type=int,
+        nargs="+",
+        default=[10, 20, 30, 40, 50],
+        help="The numbers of quantifiers to benchmark.",
+    )
+    parser.add_argument(
+        "--clause_ratio",
+        type=float,
+        default=2.0,
+        help="The number of clauses per quantifier.",
+    )
+    parser.add_argument("--instances", type=int, default=20, help="Instances per size.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'quantifiers':>11} {'clauses':>7} {'true':>5} {'mean s':>9} {'max s':>9}")
+    for quantifiers in args.quantifiers:
+        clauses = round(quantifiers * args.clause_ratio)
+        times = []
+        true_count = 0
+        for _ in range(args.instances):
+            qbf = QBF(quantifiers, get_random_3cnf(quantifiers, clauses, rng))
+            start = time.perf_counter()
+            true_count += solve_qbf(qbf)
+            times.append(time.perf_counter() - start)
+        print(
+            f"{quantifiers:>11} {clauses:>7} {true_count:>5} "
+            f"{sum(times) / len(times):>9.4f} {max(times):>9.4f}"
+        )
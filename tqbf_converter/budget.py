@@ -0,0 +1,180 @@
+#! /usr/bin/env python3.8
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional
+
+# Sizes of the generated structures in the built ROM. Collision is a stream of
+# s16 words; Vtx and Gfx are from include/PR/gbi.h; OBJECT and WARP_NODE are
+# level script commands from include/level_commands.h.
+COLLISION_WORD_BYTES = 2
+VTX_BYTES = 16
+GFX_BYTES = 8
+OBJECT_BYTES = 0x18
+WARP_NODE_BYTES = 0x08
+
+re_script_area = re.compile(r"\s*AREA\((\d+),")
+re_script_object = re.compile(r"\s*OBJECT\(")
+re_script_warp_node = re.compile(r"\s*WARP_NODE\(")
+re_gfx_command = re.compile(r"^\s*gs(?:SP|DP)\w*\(", re.MULTILINE)
+
+
+@dataclass
+class BudgetLimits:
+    # Bytes of the level data segment (segment 7). It is decompressed into the
+    # main pool, so it competes with everything else the level loads.
+    leveldata_segment_bytes: int = 0x80000
+    # Bytes of the level script commands in the script segment (segment 0x0E).
+    script_segment_bytes: int = 0x20000
+    # Surfaces loaded for one area; see alloc_surface_pools() in
+    # src/engine/surface_load.c.
+    surfaces_per_area: int = 2300
+    # Objects alive in one area; see OBJECT_POOL_CAPACITY.
+    objects_per_area: int = 240
+    # Areas 1 through 7 of gAreaData[8] in src/game/area.c.
+    areas: int = 7
+    # Warp node ids are a byte, and those from WARP_NODE_F0 up are special (see
+    # src/game/level_update.h).
+    warp_nodes_per_area: int = 0xF0
+
+
+@dataclass
+class StructureCounts:
+    collision_words: int = 0
+    collision_tris: int = 0
+    vtx: int = 0
+    gfx_commands: int = 0
+    objects: int = 0
+    warp_nodes: int = 0
+
+    @property
+    def leveldata_bytes(self) -> int:
+        return (
+            self.collision_words * COLLISION_WORD_BYTES
+            + self.vtx * VTX_BYTES
+            + self.gfx_commands * GFX_BYTES
+        )
+
+    @property
+    def script_bytes(self) -> int:
+        return self.objects * OBJECT_BYTES + self.warp_nodes * WARP_NODE_BYTES
+
+    def __add__(self, other: StructureCounts) -> StructureCounts:
+        return StructureCounts(
+            self.collision_words + other.collision_words,
+            self.collision_tris + other.collision_tris,
+            self.vtx + other.vtx,
+            self.gfx_commands + other.gfx_commands,
+            self.objects + other.objects,
+            self.warp_nodes + other.warp_nodes,
+        )
+
+
+def count_gfx_commands(rendered: str) -> int:
+    return len(re_gfx_command.findall(rendered))
+
+
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    # Split streamed text into lines without joining all of it first.
+    partial = ""
+    for chunk in chunks:
+        lines = (partial + chunk).split("\n")
+        partial = lines.pop()
+        yield from lines
+    yield partial
+
+
+def count_script_structures(script: Iterable[str]) -> Dict[int, StructureCounts]:
+    """
+    Count the objects and warp nodes in each AREA() block of a rendered
+    script.inc.c, keyed by area number. The script can be given as a stream of
+    chunks, as it is rendered.
+    """
+    counts: Dict[int, StructureCounts] = {}
+    area: Optional[StructureCounts] = None
+    for line in iter_lines(script):
+        match = re_script_area.match(line)
+        if match:
+            area = counts[int(match.group(1))] = StructureCounts()
+        elif area is None:
+            continue
+        elif re_script_object.match(line):
+            area.objects += 1
+        elif re_script_warp_node.match(line):
+            area.warp_nodes += 1
+    return counts
+
+
+def format_budget(
+    areas: Mapping[int, StructureCounts], shared: StructureCounts
+) -> List[str]:
+    header = (
+        f"{'':>8} {'col words':>10} {'tris':>6} {'vtx':>6} {'gfx':>6} "
+        f"{'objects':>8} {'warps':>6} {'seg 7 B':>9} {'script B':>9}"
+    )
+    lines = [header]
+    rows = [(f"area {num}", counts) for num, counts in sorted(areas.items())]
+    rows.append(("shared", shared))
+    total = sum(areas.values(), shared)
+    rows.append(("total", total))
+    for name, counts in rows:
+        lines.append(
+            f"{name:>8} {counts.collision_words:>10} {counts.collision_tris:>6} "
+            f"{counts.vtx:>6} {counts.gfx_commands:>6} {counts.objects:>8} "
+            f"{counts.warp_nodes:>6} {counts.leveldata_bytes:>9} "
+            f"{counts.script_bytes:>9}"
+        )
+    return lines
+
+
+def check_budget(
+    areas: Mapping[int, StructureCounts],
+    shared: StructureCounts,
+    limits: BudgetLimits,
+) -> StructureCounts:
+    """
+    Compare the estimated size of a level against `limits`. Raise a ValueError
+    with a per-area breakdown if any of them is exceeded; otherwise return the
+    level-wide totals.
+    """
+    problems: List[str] = []
+    if len(areas) > limits.areas:
+        problems.append(f"level has {len(areas)} areas (limit {limits.areas})")
+    for num, counts in sorted(areas.items()):
+        if counts.collision_tris > limits.surfaces_per_area:
+            problems.append(
+                f"area {num} has {counts.collision_tris} surfaces "
+                f"(limit {limits.surfaces_per_area})"
+            )
+        if counts.objects > limits.objects_per_area:
+            problems.append(
+                f"area {num} has {counts.objects} objects "
+                f"(limit {limits.objects_per_area})"
+            )
+        if counts.warp_nodes > limits.warp_nodes_per_area:
+            problems.append(
+                f"area {num} has {counts.warp_nodes} warp nodes "
+                f"(limit {limits.warp_nodes_per_area})"
+            )
+
+    total = sum(areas.values(), shared)
+    if total.leveldata_bytes > limits.leveldata_segment_bytes:
+        problems.append(
+            f"level data segment needs {total.leveldata_bytes:#x} bytes "
+            f"(limit {limits.leveldata_segment_bytes:#x})"
+        )
+    if total.script_bytes > limits.script_segment_bytes:
+        problems.append(
+            f"level script needs {total.script_bytes:#x} bytes "
+            f"(limit {limits.script_segment_bytes:#x})"
+        )
+
+    if problems:
+        breakdown = "\n".join(format_budget(areas, shared))
+        raise ValueError(
+            "Level exceeds its budget:\n  - "
+            + "\n  - ".join(problems)
+            + f"\nEstimated usage:\n{breakdown}"
+        )
+    return total
@@ -0,0 +1,10 @@
+import pytest
+
+from gadgets import DoorGadget, UniversalGadget
+
+
+@pytest.fixture(autouse=True)
+def clear_gadget_registries():
+    # The gadget registries are per process, so start each test afresh.
+    DoorGadget.instances.clear()
+    UniversalGadget.instances.clear()
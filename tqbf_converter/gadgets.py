@@ -155,6 +155,16 @@ class UniversalGadget:
     door_c: DoorGadget
     door_d: DoorGadget
     choice_gadget: ChoiceGadget
+    variable: int
+
+    instances: ClassVar[List[UniversalGadget]] = []
+
+    def __post_init__(self):
+        UniversalGadget.instances.append(self)
+
+    @classmethod
+    def get_instances(cls) -> List[UniversalGadget]:
+        return UniversalGadget.instances
 
 
 def create_and_hook_up_doors_universal(
@@ -205,7 +215,7 @@ def create_and_hook_up_doors_universal(
 
     # Then, hook to next quantifier again. (done in create_and_hook_up_quantifiers())
 
-    return UniversalGadget(door_a, door_b, door_c, door_d, choice_gadget)
+    return UniversalGadget(door_a, door_b, door_c, door_d, choice_gadget, variable)
 
 
 def create_and_hook_up_doors_clauses(
@@ -218,6 +228,7 @@ def create_and_hook_up_doors_clauses(
       - The ChoiceGadget for the last clause in the input.
     """
     door_gadgets_literals: DefaultDict[int, List[DoorGadget]] = defaultdict(list)
+    first_clause: Optional[ChoiceGadget] = None
     prev_door_1: Optional[DoorGadget] = None
     prev_door_2: Optional[DoorGadget] = None
     prev_door_3: Optional[DoorGadget] = None
@@ -252,6 +263,8 @@ def create_and_hook_up_doors_clauses(
         prev_door_2 = door_2
         prev_door_3 = door_3
 
+    if first_clause is None:
+        raise ValueError("The formula has no clauses.")
     return door_gadgets_literals, first_clause, clause_choice
 
 
@@ -318,10 +331,25 @@ def create_and_hook_up_quantifiers(
 
             prev_universal = curr_universal
 
-    curr_universal.door_a.path_exits[DoorEntrance.TRAVERSE] = first_clause
-    curr_universal.door_a.path_exits[DoorEntrance.CLOSE] = first_clause
+    # The innermost quantifier leads to the first clause. If it's existential,
+    # the last universal's door_a already leads to it instead.
+    if variables % 2 == 1:
+        if not prev_existential:
+            raise RuntimeError("Missing innermost existential gadget")
+        prev_existential.door_a.path_exits[DoorEntrance.TRAVERSE] = first_clause
+        prev_existential.door_b.path_exits[DoorEntrance.TRAVERSE] = first_clause
+    else:
+        curr_universal.door_a.path_exits[DoorEntrance.TRAVERSE] = first_clause
+        curr_universal.door_a.path_exits[DoorEntrance.CLOSE] = first_clause
+
+    # Without any universal quantifiers, satisfying the clauses is the end.
+    clauses_exit: Union[ChoiceGadget, EndGadget]
+    if prev_universal:
+        clauses_exit = prev_universal.choice_gadget
+    else:
+        clauses_exit = EndGadget()
     for door_path in last_clause.choices:
-        door_path[0].path_exits[door_path[1]] = curr_universal.choice_gadget
+        door_path[0].path_exits[door_path[1]] = clauses_exit
 
     if not start_gadget:
         raise RuntimeError("Start gadget never initialized - cannot proceed.")
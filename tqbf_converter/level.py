@@ -1,23 +1,53 @@
 #! /usr/bin/env python3.8
 from __future__ import annotations
 
+import hashlib
+import itertools
+import struct
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Tuple
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import jinja2
-from gadgets import DoorGadget, StartGadget
-
-
-@dataclass
-class Point3D:
+from jinja2.environment import TemplateStream
+from budget import (
+    BudgetLimits,
+    StructureCounts,
+    check_budget,
+    count_gfx_commands,
+    count_script_structures,
+)
+from gadgets import (
+    ChoiceGadget,
+    DoorEntrance,
+    DoorGadget,
+    DoorPath,
+    EndGadget,
+    StartGadget,
+)
+from overlap import Footprint, check_overlaps
+from ordering import DEFAULT_DOORS_PER_AREA
+
+
+class Point3D(NamedTuple):
     x: int
     y: int
     z: int
 
 
-@dataclass
-class WaterBox:
+class WaterBox(NamedTuple):
     x1: int
     z1: int
     x2: int
@@ -25,42 +55,82 @@ class WaterBox:
     y: int
 
 
-@dataclass
+# The level the generated files go into. Its script.c, leveldata.c, geo.c and
+# header.h include them, and moving_texture.c knows its water boxes.
+LEVEL_NAME = "castle_grounds"
+
+# From SET_HITBOX() in bhvWaterLevelDiamond.
+DIAMOND_HITBOX_RADIUS = 70
+
+
+def get_platform_verts(center: Point3D, radius: int) -> List[Point3D]:
+    # The corners of a square platform, in the order DoorInLevel uses them.
+    x, y, z = center
+    return [
+        Point3D(x - radius, y, z + radius),
+        Point3D(x + radius, y, z + radius),
+        Point3D(x + radius, y, z - radius),
+        Point3D(x - radius, y, z - radius),
+    ]
+
+
+@dataclass(frozen=True)
 class DoorInLevel:
+    # Layouts can have a great many doors, so only what differs between doors
+    # is stored; everything else is derived on demand.
+    __slots__ = ("position_traverse", "name")
+
     # The center position of the center platform of the door.
     position_traverse: Point3D
-    position_open: Point3D = field(init=False)
-    position_close: Point3D = field(init=False)
+    # The door gadget this implements.
+    name: str
 
-    diamond_positions: List[Point3D] = field(init=False)
-    diamond_height_above_platform: int = 15
+    diamond_height_above_platform: ClassVar[int] = 15
 
     # Each platform is a square with side length equal to this times 2.
-    platform_half_side_length: int = 213
+    platform_half_side_length: ClassVar[int] = 213
     # The three platforms are collinear. This is the gap between adjacent platforms.
-    gap_size_between_platforms: int = 682
-
-    height_difference_between_platforms: int = 450
-    initial_water_level_distance_below_platform: int = 100
-
-    def __post_init__(self):
-        self.position_close = Point3D(
-            self.position_traverse.x + self.gap_size_between_platforms,
-            self.position_traverse.y + self.height_difference_between_platforms,
-            self.position_traverse.z,
+    gap_size_between_platforms: ClassVar[int] = 682
+
+    height_difference_between_platforms: ClassVar[int] = 450
+    initial_water_level_distance_below_platform: ClassVar[int] = 100
+
+    @property
+    def position_close(self) -> Point3D:
+        x, y, z = self.position_traverse
+        return Point3D(
+            x + self.gap_size_between_platforms,
+            y + self.height_difference_between_platforms,
+            z,
         )
 
-        self.position_open = Point3D(
-            self.position_traverse.x - self.gap_size_between_platforms,
-            self.position_traverse.y - self.height_difference_between_platforms,
-            self.position_traverse.z,
+    @property
+    def position_open(self) -> Point3D:
+        x, y, z = self.position_traverse
+        return Point3D(
+            x - self.gap_size_between_platforms,
+            y - self.height_difference_between_platforms,
+            z,
         )
 
-        self.diamond_positions: List[Point3D] = []
-        for point in [self.position_close, self.position_open]:
-            self.diamond_positions.append(
-                Point3D(point.x, point.y + self.diamond_height_above_platform, point.z)
-            )
+    @property
+    def diamond_positions(self) -> List[Point3D]:
+        x, y, z = self.position_traverse
+        gap = self.gap_size_between_platforms
+        height = self.height_difference_between_platforms
+        above = self.diamond_height_above_platform
+        return [
+            Point3D(x + gap, y + height + above, z),
+            Point3D(x - gap, y - height + above, z),
+        ]
+
+    def get_platform_center(self, entrance: DoorEntrance) -> Point3D:
+        # Each entrance of the door gadget is a platform of its own.
+        if entrance == DoorEntrance.OPEN:
+            return self.position_open
+        if entrance == DoorEntrance.CLOSE:
+            return self.position_close
+        return self.position_traverse
 
     def get_named_centers(self) -> List[Tuple[str, Point3D]]:
         names = {
@@ -73,72 +143,362 @@ class DoorInLevel:
     def get_collision_verts(self) -> List[Point3D]:
         verts: List[Point3D] = []
 
+        x, y, z = self.position_traverse
         radius = self.platform_half_side_length
-        centers = [self.position_traverse, self.position_open, self.position_close]
-        for center in centers:
+        gap = self.gap_size_between_platforms
+        height = self.height_difference_between_platforms
+        # The traverse, open and close platforms, in that order.
+        centers = [(x, y), (x - gap, y - height), (x + gap, y + height)]
+        for center_x, center_y in centers:
             verts += [
-                Point3D(center.x - radius, center.y, center.z + radius),
-                Point3D(center.x + radius, center.y, center.z + radius),
-                Point3D(center.x + radius, center.y, center.z - radius),
-                Point3D(center.x - radius, center.y, center.z - radius),
+                Point3D(center_x - radius, center_y, z + radius),
+                Point3D(center_x + radius, center_y, z + radius),
+                Point3D(center_x + radius, center_y, z - radius),
+                Point3D(center_x - radius, center_y, z - radius),
             ]
         return verts
 
     def get_water_box_definition(self) -> WaterBox:
+        # From the far side of the open platform to the far side of the close
+        # platform, below the open platform.
+        x, y, z = self.position_traverse
+        reach = self.gap_size_between_platforms + self.platform_half_side_length
         radius = self.platform_half_side_length
         return WaterBox(
-            self.position_open.x - radius,
-            self.position_open.z - radius,
-            self.position_close.x + radius,
-            self.position_close.z + radius,
-            self.position_open.y - self.initial_water_level_distance_below_platform,
+            x - reach,
+            z - radius,
+            x + reach,
+            z + radius,
+            y
+            - self.height_difference_between_platforms
+            - self.initial_water_level_distance_below_platform,
         )
 
+    def get_footprints(self) -> List[Footprint]:
+        footprints: List[Footprint] = []
+        verts = self.get_collision_verts()
+        for i, (platform_name, _) in enumerate(self.get_named_centers()):
+            xs = [vert.x for vert in verts[4 * i : 4 * i + 4]]
+            zs = [vert.z for vert in verts[4 * i : 4 * i + 4]]
+            footprints.append(
+                Footprint(
+                    self.name,
+                    f"{platform_name} platform",
+                    min(xs),
+                    min(zs),
+                    max(xs),
+                    max(zs),
+                )
+            )
+        for diamond in self.diamond_positions:
+            radius = DIAMOND_HITBOX_RADIUS
+            footprints.append(
+                Footprint(
+                    self.name,
+                    "diamond",
+                    diamond.x - radius,
+                    diamond.z - radius,
+                    diamond.x + radius,
+                    diamond.z + radius,
+                )
+            )
+        water = self.get_water_box_definition()
+        footprints.append(
+            Footprint(self.name, "water box", water.x1, water.z1, water.x2, water.z2)
+        )
+        return footprints
 
-@dataclass
+
+@dataclass(frozen=True)
 class Area:
+    __slots__ = ("num", "doors", "start")
+
     num: int
-    door: DoorInLevel
+    # Each door has its own water box, in this order in the area's collision.
+    doors: List[DoorInLevel]
+    # The center of the platform Mario starts on, in the first area only. It
+    # has the start gadget's choice of warps.
+    start: Optional[Point3D]
+
+    def get_collision_verts(self) -> List[Point3D]:
+        verts = [vert for door in self.doors for vert in door.get_collision_verts()]
+        if self.start is not None:
+            radius = DoorInLevel.platform_half_side_length
+            verts += get_platform_verts(self.start, radius)
+        return verts
+
+    def get_footprints(self) -> List[Footprint]:
+        footprints = [
+            footprint for door in self.doors for footprint in door.get_footprints()
+        ]
+        if self.start is not None:
+            x, _, z = self.start
+            radius = DoorInLevel.platform_half_side_length
+            footprints.append(
+                Footprint(
+                    "start", "platform", x - radius, z - radius, x + radius, z + radius
+                )
+            )
+        return footprints
+
+
+@dataclass
+class SharedAsset:
+    # Position in emission order. For movtex quads, this doubles as the id of
+    # the water boxes that the quad is drawn over.
+    index: int
+    symbol: str
+    content: str
+
+
+# Assets are hashed as rendered under this symbol, so that the names they would
+# be emitted under don't make otherwise identical content look different.
+ASSET_PLACEHOLDER_SYMBOL = "shared_asset"
+
+
+@dataclass
+class AssetTable:
+    """
+    A content-hash table of rendered assets. Each distinct asset is emitted
+    once, under the symbol of its first occurrence, and shared by every area
+    that needs it.
+    """
+
+    assets: Dict[str, SharedAsset] = field(default_factory=dict)
+
+    def intern(self, render: Callable[[str], str], symbol: str) -> SharedAsset:
+        placeholder = render(ASSET_PLACEHOLDER_SYMBOL)
+        digest = hashlib.sha1(placeholder.encode()).hexdigest()
+        if digest not in self.assets:
+            self.assets[digest] = SharedAsset(len(self.assets), symbol, render(symbol))
+        return self.assets[digest]
+
+    def __iter__(self) -> Iterator[SharedAsset]:
+        return iter(self.assets.values())
+
+    def __len__(self) -> int:
+        return len(self.assets)
+
+
+class Warp(NamedTuple):
+    # A fading warp on a platform. Warping to its node lands Mario on it, and
+    # standing still on it takes him on to the destination node.
+    node: int
+    position: Point3D
+    dest_level: str
+    dest_area: int
+    dest_node: int
+
+
+@dataclass
+class AreaWarps:
+    warps: List[Warp] = field(default_factory=list)
+    # Where the end gadget's star is.
+    stars: List[Point3D] = field(default_factory=list)
+
+
+# Water box ids from 50 up are toxic gas rather than water (see
+# find_water_level() in src/engine/surface_collision.c).
+MAX_WATER_BOX_IDS = 50
+# The water levels of an area are kept in gEnvironmentLevels[20].
+WATER_BOXES_PER_AREA = 20
+# Objects in an area besides the doors' water diamonds: the water level
+# initializer.
+OBJECTS_PER_AREA_BASE = 1
+
+# Doors sharing an area are laid out on a grid, row by row, far enough apart
+# that neither their platforms nor their water boxes overlap.
+DOOR_GRID_COLUMNS = 5
+DOOR_GRID_SPACING_X = 2048
+DOOR_GRID_SPACING_Z = 1024
+# Mario starts on a platform of its own in front of the first area's doors.
+START_POSITION = Point3D(0, 0, -DOOR_GRID_SPACING_Z)
+
+# The most choices a choice gadget has (see gadgets.py), and so the most warps
+# on one platform.
+MAX_CHOICES = 3
+# The warps on a platform are lined up this far apart, so that Mario standing
+# on one is clear of the 85 unit hitbox of the next (see bhv_fading_warp_loop()).
+WARP_SPACING = 128
+STAR_HEIGHT_ABOVE_PLATFORM = 150
+
+# Values of the collision commands from include/surface_terrains.h.
+TERRAIN_LOAD_VERTICES = 0x0040
+TERRAIN_LOAD_CONTINUE = 0x0041
+TERRAIN_LOAD_END = 0x0042
+TERRAIN_LOAD_ENVIRONMENT = 0x0044
+SURFACE_DEFAULT = 0x0000
+
+# A Vtx (Vtx_t in include/PR/gbi.h): ob[3], flag, tc[2], cn[4]. The N64 is
+# big-endian, so everything here is packed as such.
+VTX_STRUCT = struct.Struct(">3hH2H4B")
+
+# Template output is handed to the file in groups of this many chunks, through
+# a buffer of this many bytes.
+STREAM_BUFFER_CHUNKS = 64
+WRITE_BUFFER_BYTES = 1 << 16
+
+
+@dataclass
+class BinaryBlob:
+    # The C symbol that the data is exported as, e.g. what the templates would
+    # otherwise have declared with an initializer list.
+    symbol: str
+    data: bytes
+
+
+def pack_collision(
+    verts: List[Point3D], water_boxes: List[Tuple[int, WaterBox]]
+) -> bytes:
+    """
+    Pack the same collision data as collision.inc.c.j2 renders into a stream
+    of big-endian s16 words. Every four consecutive verts form a platform quad,
+    and each water box comes with its id.
+    """
+    words = [TERRAIN_LOAD_VERTICES, len(verts)]
+    for vert in verts:
+        words += [vert.x, vert.y, vert.z]
+    words += [SURFACE_DEFAULT, len(verts) // 2]
+    for quad in range(0, len(verts), 4):
+        words += [quad, quad + 1, quad + 2, quad, quad + 2, quad + 3]
+    words += [TERRAIN_LOAD_CONTINUE, TERRAIN_LOAD_ENVIRONMENT, len(water_boxes)]
+    for water_id, water in water_boxes:
+        words += [water_id, water.x1, water.z1, water.x2, water.z2, water.y]
+    words += [TERRAIN_LOAD_END]
+    return struct.pack(f">{len(words)}h", *words)
+
+
+def pack_platform_vtx(radius: int) -> bytes:
+    """
+    Pack the four vertices of a platform mesh, as model.inc.c.j2 renders them.
+    """
+    normal_and_alpha = (0x0, 0x7F, 0x0, 0xFF)
+    corners = [
+        (-radius, radius, 0xFFF0, 0x3F0),
+        (radius, radius, 0x3F0, 0x3F0),
+        (radius, -radius, 0x3F0, 0xFFF0),
+        (-radius, -radius, 0xFFF0, 0xFFF0),
+    ]
+    return b"".join(
+        VTX_STRUCT.pack(x, 0, z, 0, s, t, *normal_and_alpha) for x, z, s, t in corners
+    )
 
 
 class LevelTemplateEnvironment(jinja2.Environment):
     def render_collision(
-        self, area_num: int, verts: List[Point3D], water: WaterBox
+        self,
+        area_num: int,
+        verts: List[Point3D],
+        water_boxes: List[Tuple[int, WaterBox]],
     ) -> str:
         collision_template = self.get_template("collision.inc.c.j2")
-        return collision_template.render(area_num=area_num, verts=verts, water=water)
+        return collision_template.render(
+            area_num=area_num, verts=verts, water_boxes=water_boxes
+        )
+
+    def render_movtex_quad(self, symbol: str, water: WaterBox) -> str:
+        movtex_quad_template = self.get_template("movtex_quad.inc.c.j2")
+        return movtex_quad_template.render(symbol=symbol, water=water)
 
-    def render_movtext(self, water: WaterBox) -> str:
+    def render_movtext(self, quads: List[SharedAsset]) -> str:
         movtext_template = self.get_template("movtext.inc.c.j2")
-        return movtext_template.render(water=water)
+        return movtext_template.render(quads=quads)
 
     def render_geo(self, area_num: int, centers: List[Tuple[str, Point3D]]) -> str:
         geo_template = self.get_template("geo.inc.c.j2")
         return geo_template.render(area_num=area_num, centers=centers)
 
-    def render_script(self, areas: List[Area]) -> str:
-        script_template = self.get_template("script.inc.c.j2")
-        return script_template.render(areas=areas)
+    def render_script(
+        self, areas: List[Area], warps: Mapping[int, AreaWarps]
+    ) -> TemplateStream:
+        return self.stream_template("script.inc.c.j2", areas=areas, warps=warps)
 
-    def render_model(self, platform_names: List[str], radius: int) -> str:
+    def render_mesh(self, symbol: str, radius: int, binary: bool = False) -> str:
+        # With `binary`, the Vtx array is only declared; its data is provided
+        # by a blob in bindata.s.
+        mesh_template = self.get_template("mesh.inc.c.j2")
+        return mesh_template.render(symbol=symbol, radius=radius, binary=binary)
+
+    def render_model(self, meshes: List[SharedAsset]) -> str:
         model_template = self.get_template("model.inc.c.j2")
-        return model_template.render(platform_names=platform_names, radius=radius)
+        return model_template.render(meshes=meshes)
+
+    def render_bindata(self, symbols: List[str]) -> TemplateStream:
+        return self.stream_template("bindata.s.j2", symbols=symbols)
+
+    def render_header(
+        self, areas: List[Area], meshes: List[SharedAsset]
+    ) -> TemplateStream:
+        return self.stream_template("header.inc.h.j2", areas=areas, meshes=meshes)
+
+    def render_level_geo(
+        self, areas: List[Area], geos: Optional[Mapping[int, str]] = None
+    ) -> TemplateStream:
+        # If `geos` (area number -> rendered geo.inc.c) is given, the area geo
+        # layouts are inlined instead of #included from per-area files.
+        return self.stream_template("level_geo.inc.c.j2", areas=areas, geos=geos)
+
+    def render_leveldata(
+        self,
+        areas: List[Area],
+        collisions: Optional[Mapping[int, str]] = None,
+        movtext: Optional[str] = None,
+        model: Optional[str] = None,
+        binary: bool = False,
+    ) -> TemplateStream:
+        # Likewise, any rendered data passed in here is inlined rather than
+        # #included from its own file. With `binary`, the collision lives in
+        # bindata.s and is not included at all.
+        return self.stream_template(
+            "leveldata.inc.c.j2",
+            areas=areas,
+            collisions=collisions,
+            movtext=movtext,
+            model=model,
+            binary=binary,
+        )
+
+    def stream_template(self, template_name: str, **context: Any) -> TemplateStream:
+        # The level-wide files loop over every area, so they are streamed
+        # rather than rendered into one string.
+        stream = self.get_template(template_name).stream(**context)
+        stream.enable_buffering(STREAM_BUFFER_CHUNKS)
+        return stream
+
+
+def get_template_environment(
+    template_dir: Path, level_name: str
+) -> LevelTemplateEnvironment:
+    # Every template names its symbols and include paths after the level.
+    env = LevelTemplateEnvironment(loader=jinja2.FileSystemLoader(str(template_dir)))
+    env.globals["level_name"] = level_name
+    return env
 
-    def render_header(self, areas: List[Area]) -> str:
-        header_template = self.get_template("header.inc.h.j2")
-        return header_template.render(areas=areas)
 
-    def render_level_geo(self, areas: List[Area]) -> str:
-        level_geo_template = self.get_template("level_geo.inc.c.j2")
-        return level_geo_template.render(areas=areas)
+def write_stream(stream: TemplateStream, path: Path) -> None:
+    with path.open("w", buffering=WRITE_BUFFER_BYTES) as f:
+        stream.dump(f)
 
-    def render_leveldata(self, areas: List[Area]) -> str:
-        leveldata_template = self.get_template("leveldata.inc.c.j2")
-        return leveldata_template.render(areas=areas)
 
+class LazyRenders(Mapping[int, str]):
+    """
+    Area number -> rendered text, rendered only when looked up. Passed to the
+    amalgamating templates, this keeps just one area's text in memory at a
+    time.
+    """
 
-def get_template_environment(template_dir: Path) -> LevelTemplateEnvironment:
-    return LevelTemplateEnvironment(loader=jinja2.FileSystemLoader(str(template_dir)))
+    def __init__(self, areas: List[Area], render: Callable[[Area], str]):
+        self.areas = {area.num: area for area in areas}
+        self.render = render
+
+    def __getitem__(self, num: int) -> str:
+        return self.render(self.areas[num])
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.areas)
+
+    def __len__(self) -> int:
+        return len(self.areas)
 
 
 @dataclass
@@ -150,9 +510,314 @@ class SM64Level:
     script_inc_c: str = ""
 
 
-def gadgets_to_level(start_gadget: StartGadget, level_subdir: Path) -> SM64Level:
+def get_doors_per_area(doors_per_area: int, limits: BudgetLimits) -> int:
+    """
+    How many doors go into one area: at most `doors_per_area`, and few enough
+    that every area stays within its water box, surface and object limits.
+    """
+    door = DoorInLevel(Point3D(0, 0, 0), "")
+    surfaces = len(door.get_collision_verts()) // 2
+    warps = len(DoorEntrance) * MAX_CHOICES
+    objects = len(door.diamond_positions) + warps
+    return min(
+        doors_per_area,
+        WATER_BOXES_PER_AREA,
+        limits.surfaces_per_area // surfaces,
+        (limits.objects_per_area - OBJECTS_PER_AREA_BASE) // objects,
+        limits.warp_nodes_per_area // warps,
+    )
+
+
+def get_door_grid_position(slot: int) -> Point3D:
+    row, column = divmod(slot, DOOR_GRID_COLUMNS)
+    return Point3D(
+        (column - DOOR_GRID_COLUMNS // 2) * DOOR_GRID_SPACING_X,
+        0,
+        row * DOOR_GRID_SPACING_Z,
+    )
+
+
+def pack_doors_into_areas(
+    door_gadgets: List[DoorGadget], doors_per_area: int
+) -> List[Area]:
+    """
+    Pack the doors into as few areas as possible, `doors_per_area` to an area.
+    All doors take up the same room, so filling the areas in order is an
+    optimal packing. The doors are taken in the order they were created in,
+    which keeps the literal doors of neighboring clauses together (see
+    ordering.py).
+    """
+    if doors_per_area < 1:
+        raise ValueError("At least one door has to fit into an area.")
+    areas: List[Area] = []
+    for start in range(0, len(door_gadgets), doors_per_area):
+        doors = [
+            DoorInLevel(get_door_grid_position(slot), name=door_gadget.name)
+            for slot, door_gadget in enumerate(
+                door_gadgets[start : start + doors_per_area]
+            )
+        ]
+        start = START_POSITION if not areas else None
+        areas.append(Area(num=len(areas) + 1, doors=doors, start=start))
+    return areas
+
+
+@dataclass
+class PreparedLevel:
+    """
+    The generated level, with everything worked out that is needed to write it.
+    """
+
+    areas: List[Area]
+    env: LevelTemplateEnvironment
+    radius: int
+    meshes: AssetTable
+    # Platform name -> symbol of its (possibly shared) mesh.
+    platform_meshes: Dict[str, str]
+    # Area number -> (id, water box) of each door in the area.
+    water_boxes: Dict[int, List[Tuple[int, WaterBox]]]
+    warps: Dict[int, AreaWarps]
+    model: str
+    movtext: str
+
+    def render_area_collision(self, area: Area) -> str:
+        return self.env.render_collision(
+            area.num, area.get_collision_verts(), self.water_boxes[area.num]
+        )
+
+    def render_area_geo(self, area: Area) -> str:
+        centers = [
+            (self.platform_meshes[platform_name], center)
+            for door in area.doors
+            for platform_name, center in door.get_named_centers()
+        ]
+        if area.start is not None:
+            centers.append((self.platform_meshes["Traverse"], area.start))
+        return self.env.render_geo(area.num, centers)
+
+
+def get_exit_targets(
+    exit_gadget: Union[DoorPath, ChoiceGadget, EndGadget, None],
+) -> List[Optional[DoorPath]]:
+    # Where the warps of a platform lead, one per warp. The end gadget only
+    # gets a warp to land on, which is None.
+    if exit_gadget is None:
+        return []
+    if isinstance(exit_gadget, ChoiceGadget):
+        return list(exit_gadget.choices)
+    if isinstance(exit_gadget, EndGadget):
+        return [None]
+    return [exit_gadget]
+
+
+def get_warp_positions(center: Point3D, count: int) -> List[Point3D]:
+    x, y, z = center
+    return [
+        Point3D(x, y, z + (2 * i - (count - 1)) * WARP_SPACING // 2)
+        for i in range(count)
+    ]
+
+
+def place_warps(areas: List[Area], start_gadget: StartGadget) -> Dict[int, AreaWarps]:
+    """
+    Lay out the warps of every area, following the gadget
+    graph. Each platform has a fading warp for every place its exit leads to:
+    one for a door entrance, one per choice for a choice gadget. Warping to a
+    platform lands Mario on its first warp, so the warp nodes of each area are
+    numbered in the order of its doors and their entrances. A platform that
+    leads to the end gadget gets the star, and a warp that leads back to
+    itself, only to land on.
+    """
+    door_gadgets = {door.name: door for door in DoorGadget.get_instances()}
+    level = f"LEVEL_{LEVEL_NAME.upper()}"
+    # (door name, entrance) -> (area number, node) that lands there.
+    landings: Dict[Tuple[str, DoorEntrance], Tuple[int, int]] = {}
+    # Each warp with the door entrance it leads to, until all landings are known.
+    unresolved: List[Tuple[AreaWarps, int, int, Point3D, Optional[DoorPath]]] = []
+    warps: Dict[int, AreaWarps] = {}
+    for area in areas:
+        area_warps = warps[area.num] = AreaWarps()
+        nodes = itertools.count()
+        platforms = [
+            (
+                door.get_platform_center(entrance),
+                door_gadgets[door.name].path_exits.get(entrance),
+                (door.name, entrance),
+            )
+            for door in area.doors
+            for entrance in DoorEntrance
+        ]
+        if area.start is not None:
+            platforms.append((area.start, start_gadget.path_to, None))
+        for center, exit_gadget, landing in platforms:
+            if isinstance(exit_gadget, EndGadget):
+                x, y, z = center
+                area_warps.stars.append(Point3D(x, y + STAR_HEIGHT_ABOVE_PLATFORM, z))
+            targets = get_exit_targets(exit_gadget)
+            positions = get_warp_positions(center, len(targets))
+            for i, (target, position) in enumerate(zip(targets, positions)):
+                node = next(nodes)
+                if i == 0 and landing is not None:
+                    landings[landing] = (area.num, node)
+                unresolved.append((area_warps, area.num, node, position, target))
+
+    for area_warps, area_num, node, position, target in unresolved:
+        if target is None:
+            dest = (area_num, node)
+        else:
+            door, entrance = target
+            if (door.name, entrance) not in landings:
+                raise RuntimeError(f"Nothing to land on at {entrance}{door.name}.")
+            dest = landings[(door.name, entrance)]
+        area_warps.warps.append(Warp(node, position, level, *dest))
+    return warps
+
+
+def prepare_level(
+    areas: List[Area],
+    warps: Dict[int, AreaWarps],
+    binary: bool,
+    limits: BudgetLimits,
+) -> PreparedLevel:
+    template_dir = Path(__file__).parent / "templates"
+    env = get_template_environment(template_dir, LEVEL_NAME)
+
+    radius = areas[0].doors[0].platform_half_side_length
+    platform_names = ["Open", "Traverse", "Close"]
+
+    # Identical platform meshes and movtex quads are emitted only once.
+    meshes = AssetTable()
+    platform_meshes: Dict[str, str] = {}
+    for platform_name in platform_names:
+        symbol = f"{LEVEL_NAME}_{platform_name}_mesh"
+        mesh = meshes.intern(
+            lambda name: env.render_mesh(name, radius, binary=binary), symbol
+        )
+        platform_meshes[platform_name] = mesh.symbol
+    movtex_quads = AssetTable()
+
+    water_boxes: Dict[int, List[Tuple[int, WaterBox]]] = {}
+    area_counts: Dict[int, StructureCounts] = {}
+    script_counts = count_script_structures(env.render_script(areas, warps))
+    for area in areas:
+        verts = area.get_collision_verts()
+        water_boxes[area.num] = []
+        for i, door in enumerate(area.doors):
+            water = door.get_water_box_definition()
+            # Water boxes with the same footprint share an id, and with it the
+            # movtex quad drawn over them; the water level itself is per box.
+            quad = movtex_quads.intern(
+                lambda name: env.render_movtex_quad(name, water),
+                f"{LEVEL_NAME}_movtex_area_{area.num}_water_{i}",
+            )
+            water_boxes[area.num].append((quad.index, water))
+
+        collision_data = pack_collision(verts, water_boxes[area.num])
+        collision_counts = StructureCounts(
+            collision_words=len(collision_data) // 2, collision_tris=len(verts) // 2
+        )
+        area_counts[area.num] = collision_counts + script_counts.get(
+            area.num, StructureCounts()
+        )
+
+    if len(movtex_quads) > MAX_WATER_BOX_IDS:
+        raise ValueError(
+            f"The level needs {len(movtex_quads)} distinct water boxes, but only "
+            f"{MAX_WATER_BOX_IDS} water box ids are available."
+        )
+
+    model = env.render_model(list(meshes))
+    movtext = env.render_movtext(list(movtex_quads))
+
+    shared_counts = StructureCounts(
+        vtx=len(meshes) * len(pack_platform_vtx(radius)) // VTX_STRUCT.size,
+        gfx_commands=count_gfx_commands(model),
+    )
+    total = check_budget(area_counts, shared_counts, limits)
+    print(
+        f"Estimated size of {LEVEL_NAME}: {total.leveldata_bytes:#x} bytes of "
+        f"level data, {total.script_bytes:#x} bytes of level script"
+    )
+    return PreparedLevel(
+        areas,
+        env,
+        radius,
+        meshes,
+        platform_meshes,
+        water_boxes,
+        warps,
+        model,
+        movtext,
+    )
+
+
+def write_level(
+    prepared: PreparedLevel, level_subdir: Path, amalgamate: bool, binary: bool
+) -> None:
+    env = prepared.env
+    areas = prepared.areas
+    level_subdir.mkdir(parents=True, exist_ok=True)
+    if binary:
+        blob_symbols: List[str] = []
+        for mesh in prepared.meshes:
+            blob = BinaryBlob(f"{mesh.symbol}_vtx", pack_platform_vtx(prepared.radius))
+            (level_subdir / f"{blob.symbol}.bin").write_bytes(blob.data)
+            blob_symbols.append(blob.symbol)
+        for area in areas:
+            collision_data = pack_collision(
+                area.get_collision_verts(), prepared.water_boxes[area.num]
+            )
+            blob = BinaryBlob(f"{LEVEL_NAME}_area_{area.num}_collision", collision_data)
+            (level_subdir / f"{blob.symbol}.bin").write_bytes(blob.data)
+            blob_symbols.append(blob.symbol)
+        write_stream(env.render_bindata(blob_symbols), level_subdir / "bindata.s")
+    if amalgamate:
+        level_geo = env.render_level_geo(
+            areas, geos=LazyRenders(areas, prepared.render_area_geo)
+        )
+        leveldata = env.render_leveldata(
+            areas,
+            collisions=LazyRenders(areas, prepared.render_area_collision),
+            movtext=prepared.movtext,
+            model=prepared.model,
+            binary=binary,
+        )
+    else:
+        level_geo = env.render_level_geo(areas)
+        leveldata = env.render_leveldata(areas, binary=binary)
+        for area in areas:
+            area_dir = level_subdir / f"area_{area.num}"
+            area_dir.mkdir(parents=True, exist_ok=True)
+            if not binary:
+                (area_dir / "collision.inc.c").write_text(
+                    prepared.render_area_collision(area)
+                )
+            (area_dir / "geo.inc.c").write_text(prepared.render_area_geo(area))
+        (level_subdir / "movtext.inc.c").write_text(prepared.movtext)
+        (level_subdir / "model.inc.c").write_text(prepared.model)
+
+    write_stream(
+        env.render_script(areas, prepared.warps), level_subdir / "script.inc.c"
+    )
+    write_stream(
+        env.render_header(areas, list(prepared.meshes)), level_subdir / "header.inc.h"
+    )
+    write_stream(level_geo, level_subdir / "geo.inc.c")
+    write_stream(leveldata, level_subdir / "leveldata.inc.c")
+
+
+def gadgets_to_level(
+    start_gadget: StartGadget,
+    level_subdir: Path,
+    amalgamate: bool = False,
+    binary: bool = False,
+    limits: Optional[BudgetLimits] = None,
+    doors_per_area: int = DEFAULT_DOORS_PER_AREA,
+) -> SM64Level:
     # Rough strategy:
-    #  - Every door has its own area so it can have its own water level.
+    #  - Every door has its own water box so it can have its own water level.
+    #    Several doors can share an area; each of their water diamonds is bound
+    #    to the door's box by its behavior param (see wdw_water_level.inc.c).
     #  - Every door has three platform and two water diamonds.
     #    The platforms have one-way warps leading to other doors.
     #  - The "OPEN" path of a door has an optional water diamond.
@@ -161,48 +826,46 @@ def gadgets_to_level(start_gadget: StartGadget, level_subdir: Path) -> SM64Level
     #    The "TRAVERSE" path has a door (or a warp? haven't decided).
     #    The idea is that you can't use the door while it's underwater.
     #  - A choice gadget is implemented as a platform with the required
-    #    number of warps. (All choice gadgets here have fan-out 2 or 3.)
-    #  - The StartGadget is where Mario starts when he begins the level.
+    #    number of warps. (All choice gadgets here have fan-out 2 or 3.) The
+    #    platforms leading into one carry its warps themselves; see
+    #    place_warps().
+    #  - The StartGadget is where Mario starts when he begins the level: a
+    #    platform of its own in the first area.
     #  - The EndGadget contains a star.
+    #
+    # With `amalgamate`, no per-area files are written: every area's collision
+    # is inlined into leveldata.inc.c and every area's geo into geo.inc.c, in
+    # area order. This saves the SM64 build from opening and preprocessing
+    # two tiny includes per area.
+    #
+    # With `binary`, the collision data (including the water boxes) and the
+    # platform Vtx arrays are packed into big-endian blobs instead of C
+    # initializer lists. bindata.s .incbin's them under the same symbol names
+    # the C templates would have used, so nothing else has to change.
+    #
+    # Before anything is written, the layout is checked for overlapping
+    # platforms, diamonds and water boxes of different doors, and the size of
+    # the level is estimated and checked against `limits`, so that
+    # overflowing a segment or pool shows up here rather than after a full
+    # SM64 build.
+    #
+    # The level-wide files are streamed to disk, and per-area data is rendered
+    # (or packed) only as it is written, so memory use doesn't grow with the
+    # number of areas. The script is streamed twice: once to count it for the
+    # estimate and once to write it.
     print("List of doors")
     for door2 in DoorGadget.get_instances():
         print(door2.name)
 
-    template_dir = Path(__file__).parent / "templates"
-    env = get_template_environment(template_dir)
+    limits = limits or BudgetLimits()
+    areas = pack_doors_into_areas(
+        DoorGadget.get_instances(), get_doors_per_area(doors_per_area, limits)
+    )
 
-    areas = [
-        Area(num=1, door=DoorInLevel(Point3D(0, 0, 0))),
-        Area(num=2, door=DoorInLevel(Point3D(0, 0, 700))),
-    ]
-    script = env.render_script(areas)
-    header = env.render_header(areas)
-    level_geo = env.render_level_geo(areas)
-    leveldata = env.render_leveldata(areas)
+    check_overlaps({area.num: area.get_footprints() for area in areas})
 
-    for area in areas:
-        door = area.door
-        verts = door.get_collision_verts()
-        water = door.get_water_box_definition()
-        centers = door.get_named_centers()
-        radius = door.platform_half_side_length
-        platform_names = ["Open", "Traverse", "Close"]
-
-        collision = env.render_collision(area.num, verts, water)
-        movtext = env.render_movtext(water)
-        geo = env.render_geo(area.num, centers)
-        model = env.render_model(platform_names, radius)
-
-        (level_subdir / f"area_{area.num}").mkdir(parents=True, exist_ok=True)
-        (level_subdir / f"area_{area.num}" / "collision.inc.c").write_text(collision)
-        if area.num == 1:  # manual hack for now
-            (level_subdir / f"area_{area.num}" / "movtext.inc.c").write_text(movtext)
-        (level_subdir / f"area_{area.num}" / "geo.inc.c").write_text(geo)
-
-    (level_subdir / "model.inc.c").write_text(model)
-    (level_subdir / "script.inc.c").write_text(script)
-    (level_subdir / "header.inc.h").write_text(header)
-    (level_subdir / "geo.inc.c").write_text(level_geo)
-    (level_subdir / "leveldata.inc.c").write_text(leveldata)
+    warps = place_warps(areas, start_gadget)
+    prepared = prepare_level(areas, warps, binary, limits)
+    write_level(prepared, level_subdir, amalgamate, binary)
 
     return SM64Level()
@@ -1,13 +1,31 @@
 #! /usr/bin/env python3.8
 import argparse
+import time
 from pathlib import Path
+from typing import Optional
 
+from budget import BudgetLimits
 from gadgets import create_and_hook_up_doors_clauses, create_and_hook_up_quantifiers
 from level import SM64Level, gadgets_to_level
+from ordering import (
+    DEFAULT_DOORS_PER_AREA,
+    get_ordering_cost,
+    optimize_clause_order,
+)
 from parse_qbf import QBF, get_3cnf_from_formula, verify_formula
+from qdpll import solve_qbf
+from strategy import find_winning_path, write_strategy
 
 
-def translate_to_level(qbf: QBF, level_subdir: Path) -> SM64Level:
+def translate_to_level(
+    qbf: QBF,
+    level_subdir: Path,
+    amalgamate: bool = False,
+    binary: bool = False,
+    limits: Optional[BudgetLimits] = None,
+    strategy_file: Optional[Path] = None,
+    doors_per_area: int = DEFAULT_DOORS_PER_AREA,
+) -> SM64Level:
     door_gadgets_literals, first_clause, last_clause = create_and_hook_up_doors_clauses(
         qbf.formula.clauses
     )
@@ -16,7 +34,24 @@ def translate_to_level(qbf: QBF, level_subdir: Path) -> SM64Level:
     )
     print(start_gadget)
 
-    return gadgets_to_level(start_gadget, level_subdir)
+    if strategy_file:
+        moves = find_winning_path(start_gadget)
+        if moves is None:
+            print("The formula is false, so there is no winning strategy.")
+        else:
+            write_strategy(moves, strategy_file)
+            print(
+                f"Wrote a winning strategy ({len(moves)} choices) to {strategy_file}."
+            )
+
+    return gadgets_to_level(
+        start_gadget,
+        level_subdir,
+        amalgamate=amalgamate,
+        binary=binary,
+        limits=limits,
+        doors_per_area=doors_per_area,
+    )
 
 
 if __name__ == "__main__":
@@ -28,11 +63,13 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "quantifiers",
+        nargs="?",
         type=int,
         help=(
             "The number of alternating quantifiers in the formula, 1-indexed, where "
             "the first quantifier is EXISTS(). If this number is odd, the last "
-            "quantifier is EXISTS(). If it is even, the last quantifier is FORALL()."
+            "quantifier is EXISTS(). If it is even, the last quantifier is FORALL(). "
+            "If unspecified, this is the largest variable in the formula."
         ),
     )
     parser.add_argument(
@@ -54,14 +91,142 @@ if __name__ == "__main__":
             "defaults to 'output' next to the source code of this program."
         ),
     )
+    parser.add_argument(
+        "--amalgamate",
+        action="store_true",
+        help=(
+            "Render all areas into a single leveldata.inc.c and a single "
+            "geo.inc.c instead of writing per-area collision.inc.c and geo.inc.c "
+            "files. This cuts down on includes the SM64 build has to process."
+        ),
+    )
+    parser.add_argument(
+        "--binary",
+        action="store_true",
+        help=(
+            "Emit the collision data and platform vertices as big-endian binary "
+            "blobs, included through a generated bindata.s, instead of as C "
+            "initializer lists. Speeds up compiling large levels."
+        ),
+    )
+    default_limits = BudgetLimits()
+    parser.add_argument(
+        "--max_leveldata_bytes",
+        default=default_limits.leveldata_segment_bytes,
+        type=lambda value: int(value, 0),
+        help="Fail if the level data segment (segment 7) would exceed this size.",
+    )
+    parser.add_argument(
+        "--max_script_bytes",
+        default=default_limits.script_segment_bytes,
+        type=lambda value: int(value, 0),
+        help="Fail if the level script commands would exceed this size.",
+    )
+    parser.add_argument(
+        "--max_surfaces_per_area",
+        default=default_limits.surfaces_per_area,
+        type=int,
+        help="Fail if any area would load more collision surfaces than this.",
+    )
+    parser.add_argument(
+        "--max_objects_per_area",
+        default=default_limits.objects_per_area,
+        type=int,
+        help="Fail if any area would spawn more objects than this.",
+    )
+    parser.add_argument(
+        "--max_areas",
+        default=default_limits.areas,
+        type=int,
+        help="Fail if the level would need more areas than this.",
+    )
+    parser.add_argument(
+        "--max_warp_nodes_per_area",
+        default=default_limits.warp_nodes_per_area,
+        type=lambda value: int(value, 0),
+        help="Fail if any area would need more warp nodes than this.",
+    )
+    parser.add_argument(
+        "--strategy",
+        type=Path,
+        help=(
+            "If the formula is true, write the sequence of choices that reaches "
+            "the star to this file, one line per choice gadget, with universal "
+            "branches indented."
+        ),
+    )
+    parser.add_argument(
+        "--solve",
+        action="store_true",
+        help=(
+            "Decide whether the formula is true with a QDPLL solver before "
+            "building the level, and report the result and how long it took."
+        ),
+    )
+    parser.add_argument(
+        "--optimize_order",
+        action="store_true",
+        help=(
+            "Reorder the clauses, and the literals within them, so that the "
+            "literal doors each quantifier warps through are closer together. "
+            "Reports the total number of warps between areas before and after."
+        ),
+    )
+    parser.add_argument(
+        "--doors_per_area",
+        default=DEFAULT_DOORS_PER_AREA,
+        type=int,
+        help=(
+            "How many doors share an area, each with its own water box. Fewer "
+            "are used if an area would exceed its limits. With 1, every door "
+            "gets an area of its own."
+        ),
+    )
     args = parser.parse_args()
 
-    if args.quantifiers < 1:
-        raise ValueError("You need at least one literal for a proper formula.")
-
     formula_3cnf = get_3cnf_from_formula(args.formula)
-    verify_formula(args.quantifiers, formula_3cnf)
-    input_qbf = QBF(args.quantifiers, formula_3cnf)
+    report = verify_formula(formula_3cnf, args.quantifiers)
+    for warning in report.get_warnings():
+        print(f"Warning: {warning}")
+    quantifiers = report.variables
 
-    level = translate_to_level(input_qbf, args.level_subdir)
+    if args.optimize_order:
+        before = get_ordering_cost(
+            quantifiers, formula_3cnf.clauses, args.doors_per_area
+        )
+        formula_3cnf = optimize_clause_order(
+            quantifiers, formula_3cnf, args.doors_per_area
+        )
+        after = get_ordering_cost(
+            quantifiers, formula_3cnf.clauses, args.doors_per_area
+        )
+        print(
+            f"Warp hops between areas: {before.warp_hops} -> {after.warp_hops} "
+            f"(chain length {before.chain_length} -> {after.chain_length})"
+        )
+    input_qbf = QBF(quantifiers, formula_3cnf)
+
+    if args.solve:
+        start = time.perf_counter()
+        value = solve_qbf(input_qbf)
+        elapsed = time.perf_counter() - start
+        print(f"The formula is {str(value).lower()} (solved in {elapsed:.4f} s).")
+
+    limits = BudgetLimits(
+        leveldata_segment_bytes=args.max_leveldata_bytes,
+        script_segment_bytes=args.max_script_bytes,
+        surfaces_per_area=args.max_surfaces_per_area,
+        objects_per_area=args.max_objects_per_area,
+        areas=args.max_areas,
+        warp_nodes_per_area=args.max_warp_nodes_per_area,
+    )
+    level = translate_to_level(
+        input_qbf,
+        args.level_subdir,
+        args.amalgamate,
+        args.binary,
+        limits,
+        args.strategy,
+        args.doors_per_area,
+    )
     print(level)
@@ -0,0 +1,106 @@
+#! /usr/bin/env python3.8
+from __future__ import annotations
+
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import DefaultDict, List, Sequence
+
+from parse_qbf import CNF_3, Clause
+
+# How many doors share an area, unless that area would exceed its limits. The
+# literal doors come first, so they are packed in clause order too.
+DEFAULT_DOORS_PER_AREA = 8
+
+
+@dataclass
+class OrderingCost:
+    # Warps between doors in different areas.
+    warp_hops: int
+    # The summed distance, in door slots, between consecutive doors of a chain.
+    chain_length: int
+
+
+def get_chains(variables: int, clauses: Sequence[Clause]) -> List[List[int]]:
+    """
+    Return the chains of literal doors that the quantifier gadgets warp through,
+    as lists of door slots. Literal doors are laid out in clause order, three
+    per clause, matching create_and_hook_up_doors_clauses().
+    """
+    slots: DefaultDict[int, List[int]] = defaultdict(list)
+    for i, clause in enumerate(clauses):
+        for j, literal in enumerate(clause):
+            slots[literal].append(3 * i + j)
+
+    chains: List[List[int]] = []
+    for variable in range(1, variables + 1):
+        positive = slots[variable] + slots[-variable]
+        if variable % 2 == 1:
+            # Door B sets the variable to true, door A to false.
+            chains += [positive, slots[-variable] + slots[variable]]
+        else:
+            # Door D and door B both go through the true literals first.
+            chains += [positive, positive]
+    # Every door of a clause leads on to the next clause, whose choice gadget
+    # sits with that clause's first door.
+    for i in range(len(clauses) - 1):
+        chains += [[3 * i + j, 3 * (i + 1)] for j in range(3)]
+    return chains
+
+
+def get_ordering_cost(
+    variables: int, clauses: Sequence[Clause], doors_per_area: int
+) -> OrderingCost:
+    warp_hops = 0
+    chain_length = 0
+    for chain in get_chains(variables, clauses):
+        for slot, next_slot in zip(chain, chain[1:]):
+            if slot // doors_per_area != next_slot // doors_per_area:
+                warp_hops += 1
+            chain_length += abs(next_slot - slot)
+    return OrderingCost(warp_hops, chain_length)
+
+
+def order_clauses_greedy(
+    clauses: Sequence[Clause], doors_per_area: int
+) -> List[Clause]:
+    """
+    Place clauses one at a time, always taking the one that shares the most
+    variables with the doors placed last (ties go to the earliest clause), and
+    putting its literals on already-present variables first, so that they land
+    in the same area.
+    """
+    remaining = list(range(len(clauses)))
+    ordered: List[Clause] = []
+    recent: List[int] = []
+    while remaining:
+        window = Counter(recent[-doors_per_area:])
+        best = max(
+            remaining,
+            key=lambda i: (sum(window[abs(literal)] for literal in clauses[i]), -i),
+        )
+        remaining.remove(best)
+        clause = clauses[best]
+        order = sorted(range(3), key=lambda j: (-window[abs(clause[j])], j))
+        literal_1, literal_2, literal_3 = (clause[j] for j in order)
+        ordered.append((literal_1, literal_2, literal_3))
+        recent += [abs(literal_1), abs(literal_2), abs(literal_3)]
+    return ordered
+
+
+def optimize_clause_order(
+    variables: int, formula: CNF_3, doors_per_area: int = DEFAULT_DOORS_PER_AREA
+) -> CNF_3:
+    """
+    Reorder the clauses of `formula`, and the literals within them, to cut down
+    on warps between areas. The result is deterministic, and never costs more
+    warp hops than the input order.
+    """
+    ordered = order_clauses_greedy(formula.clauses, doors_per_area)
+    before = get_ordering_cost(variables, formula.clauses, doors_per_area)
+    after = get_ordering_cost(variables, ordered, doors_per_area)
+    if (after.warp_hops, after.chain_length) >= (
+        before.warp_hops,
+        before.chain_length,
+    ):
+        return CNF_3(list(formula.clauses))
+    return CNF_3(ordered)
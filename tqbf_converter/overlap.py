@@ -0,0 +1,76 @@
+#! /usr/bin/env python3.8
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import DefaultDict, List, Mapping, Set, Tuple
+
+# Side length of the grid cells that footprints are bucketed into. Platforms,
+# diamonds and water boxes are all within a few cells of this.
+DEFAULT_CELL_SIZE = 1024
+
+
+@dataclass
+class Footprint:
+    """
+    The extent of something in the level, seen from above (x, z), along with
+    the name of the gadget it belongs to.
+    """
+
+    owner: str
+    kind: str
+    x1: int
+    z1: int
+    x2: int
+    z2: int
+
+    def overlaps(self, other: Footprint) -> bool:
+        # Footprints that only touch along an edge don't overlap.
+        return (
+            self.x1 < other.x2
+            and other.x1 < self.x2
+            and self.z1 < other.z2
+            and other.z1 < self.z2
+        )
+
+    def __str__(self):
+        return f"{self.owner} {self.kind}"
+
+
+def find_overlaps(
+    footprints: List[Footprint], cell_size: int = DEFAULT_CELL_SIZE
+) -> List[Tuple[Footprint, Footprint]]:
+    """
+    Return every pair of overlapping footprints with different owners, in
+    input order. Footprints are bucketed into a uniform grid, so only those
+    sharing a cell are compared.
+    """
+    cells: DefaultDict[Tuple[int, int], List[int]] = defaultdict(list)
+    for i, footprint in enumerate(footprints):
+        for x in range(footprint.x1 // cell_size, footprint.x2 // cell_size + 1):
+            for z in range(footprint.z1 // cell_size, footprint.z2 // cell_size + 1):
+                cells[(x, z)].append(i)
+
+    pairs: Set[Tuple[int, int]] = set()
+    for members in cells.values():
+        for k, i in enumerate(members):
+            for j in members[k + 1 :]:
+                footprint, other = footprints[i], footprints[j]
+                if footprint.owner != other.owner and footprint.overlaps(other):
+                    pairs.add((i, j))
+    return [(footprints[i], footprints[j]) for i, j in sorted(pairs)]
+
+
+def check_overlaps(
+    areas: Mapping[int, List[Footprint]], cell_size: int = DEFAULT_CELL_SIZE
+) -> None:
+    """
+    Raise a ValueError naming the conflicting gadgets if any footprints of
+    different gadgets overlap within an area.
+    """
+    problems: List[str] = []
+    for num, footprints in sorted(areas.items()):
+        for footprint, other in find_overlaps(footprints, cell_size):
+            problems.append(f"area {num}: {footprint} overlaps {other}")
+    if problems:
+        raise ValueError("Level layout has overlaps:\n  - " + "\n  - ".join(problems))
@@ -1,7 +1,9 @@
 #! /usr/bin/env python3
 
+import random
+from itertools import chain
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Iterable, List, Optional, Tuple
 
 # A clause, in 3CNF, is composed of 3 literals.
 # Each literal can be positive or negative (but not 0).
@@ -44,11 +46,101 @@ def get_3cnf_from_formula(formula: str) -> CNF_3:
     return CNF_3(clauses)
 
 
-def verify_formula(quantifiers: int, formula: CNF_3) -> None:
-    for clause in formula.clauses:
-        for literal in clause:
-            if literal > quantifiers or literal < -quantifiers:
-                raise ValueError(
-                    f"Formula verification failed! The literal {literal} in clause "
-                    f"{clause} exceeds the given number of quantifiers {quantifiers}."
+@dataclass
+class FormulaReport:
+    # The number of quantifiers, as given or as inferred from the formula.
+    variables: int
+    # Clauses that repeat a literal. They're valid, but need more doors than
+    # necessary.
+    duplicate_literal_clauses: List[Clause]
+    # Variables that no clause mentions.
+    unused_variables: List[int]
+    # The number of quantifiers needed once unused variables are dropped. The
+    # used variables keep their order and quantifier, so only unused variables
+    # that don't separate two variables of the other quantifier can go.
+    compacted_variables: int
+
+    def get_warnings(self) -> List[str]:
+        warnings = [
+            f"Clause {clause} repeats a literal."
+            for clause in self.duplicate_literal_clauses
+        ]
+        if self.unused_variables:
+            warnings.append(
+                f"Variables {self.unused_variables} are unused; dropping them would "
+                f"take {self.compacted_variables} instead of {self.variables} "
+                "quantifiers."
+            )
+        return warnings
+
+
+def get_compacted_variables(variables: int, used: Iterable[int]) -> int:
+    # Renumber the used variables in order, each to the smallest index with
+    # the same parity (i.e. quantifier) that comes after the previous one.
+    last = 0
+    for variable in sorted(used):
+        last += 1 if (variable - last) % 2 == 1 else 2
+    return last
+
+
+def verify_formula(formula: CNF_3, quantifiers: Optional[int] = None) -> FormulaReport:
+    """
+    Check the literals of the formula, and raise a ValueError listing all
+    problems at once: literals beyond the number of quantifiers and literals
+    that are 0. If `quantifiers` isn't given, it is inferred as the largest
+    variable in the formula. Otherwise, return what could be improved.
+    """
+    # The common case, a valid formula, only needs passes over the flattened
+    # literals by builtins; the literal-by-literal loop only runs to report
+    # problems.
+    literals = list(chain.from_iterable(formula.clauses))
+    used = set(map(abs, literals))
+    variables = max(used, default=0) if quantifiers is None else quantifiers
+
+    problems: List[str] = []
+    if variables < 1:
+        problems.append("You need at least one literal for a proper formula.")
+    if 0 in used or max(used, default=0) > variables:
+        for i, literal in enumerate(literals):
+            clause = formula.clauses[i // 3]
+            if literal == 0:
+                # Once per clause is enough.
+                if 0 not in literals[i - i % 3 : i]:
+                    problems.append(
+                        f"Clause {clause} contains 0, which isn't a literal."
+                    )
+            elif abs(literal) > variables:
+                problems.append(
+                    f"The literal {literal} in clause {clause} exceeds the given "
+                    f"number of quantifiers {variables}."
                 )
+    if problems:
+        raise ValueError("Formula verification failed!\n  - " + "\n  - ".join(problems))
+
+    return FormulaReport(
+        variables,
+        [
+            clause
+            for clause in formula.clauses
+            if clause[0] == clause[1]
+            or clause[1] == clause[2]
+            or clause[0] == clause[2]
+        ],
+        sorted(set(range(1, variables + 1)) - used),
+        get_compacted_variables(variables, used),
+    )
+
+
+def get_random_3cnf(variables: int, clauses: int, rng: random.Random) -> CNF_3:
+    # Uniformly random literals, e.g. for benchmarking. Clauses may repeat
+    # variables, just like user-provided formulas can.
+    return CNF_3(
+        [
+            (
+                rng.choice((1, -1)) * rng.randint(1, variables),
+                rng.choice((1, -1)) * rng.randint(1, variables),
+                rng.choice((1, -1)) * rng.randint(1, variables),
+            )
+            for _ in range(clauses)
+        ]
+    )
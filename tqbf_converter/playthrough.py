@@ -0,0 +1,465 @@
+#! /usr/bin/env python3.8
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from gadgets import DoorEntrance
+from level import STAR_HEIGHT_ABOVE_PLATFORM, DoorInLevel, Point3D
+from main import translate_to_level
+from parse_qbf import QBF, get_3cnf_from_formula, verify_formula
+from qdpll import solve_qbf
+
+# An area of a level, as its LEVEL_* constant and area number.
+AreaKey = Tuple[str, int]
+# A warp node of an area.
+NodeKey = Tuple[str, int, int]
+
+AREA_RE = re.compile(r"AREA\((\d+), (\w+)_area_\d+_level\)")
+COMMAND_RE = re.compile(r"(OBJECT|WARP_NODE|MARIO_POS)\((.*)\),")
+COMMENT_RE = re.compile(r"/\*.*?\*/")
+
+
+@dataclass
+class Platform:
+    area: AreaKey
+    center: Point3D
+    # The bit of the door states for the door this is a platform of, and which
+    # of its platforms it is. The start platform belongs to no door.
+    door: int = 0
+    entrance: Optional[DoorEntrance] = None
+    # The warp nodes of the fading warps on the platform, in order.
+    nodes: List[int] = field(default_factory=list)
+    star: bool = False
+
+
+@dataclass
+class RenderedLevel:
+    """
+    The platforms and warps of a generated level, as read back from the
+    OBJECT(), WARP_NODE() and MARIO_POS() commands of its script.inc.c files.
+    Each pair of water level diamonds marks a door, and with it the door's
+    three platforms.
+    """
+
+    platforms: List[Platform]
+    # The platform each warp node is on, and the warp node it leads to.
+    warps: Dict[NodeKey, Tuple[int, NodeKey]]
+    start: int
+    doors: int
+
+    @classmethod
+    def from_scripts(cls, scripts: Iterable[str]) -> RenderedLevel:
+        diamonds: Dict[AreaKey, Dict[int, List[Point3D]]] = {}
+        fading_warps: List[Tuple[NodeKey, Point3D]] = []
+        stars: List[Tuple[AreaKey, Point3D]] = []
+        warp_nodes: Dict[NodeKey, NodeKey] = {}
+        mario_pos: Optional[Tuple[AreaKey, Point3D]] = None
+        for script in scripts:
+            area: Optional[AreaKey] = None
+            for line in script.splitlines():
+                match = AREA_RE.search(line)
+                if match:
+                    area = (f"LEVEL_{match[2].upper()}", int(match[1]))
+                    diamonds[area] = {}
+                    continue
+                match = COMMAND_RE.search(COMMENT_RE.sub("", line))
+                if not match:
+                    continue
+                args = [arg.strip() for arg in match[2].split(",")]
+                if match[1] == "MARIO_POS":
+                    level = area[0] if area else ""
+                    position = Point3D(*(int(arg) for arg in args[2:5]))
+                    mario_pos = ((level, int(args[0], 0)), position)
+                    continue
+                if area is None:
+                    raise RuntimeError(f"{match[1]} outside of an area: {line}")
+                if match[1] == "WARP_NODE":
+                    node = (*area, int(args[0], 0))
+                    warp_nodes[node] = (args[1], int(args[2], 0), int(args[3], 0))
+                    continue
+                position = Point3D(*(int(arg) for arg in args[1:4]))
+                behavior, param = args[8], int(args[7], 0) >> 16
+                if behavior == "bhvWaterLevelDiamond":
+                    diamonds[area].setdefault(param, []).append(position)
+                elif behavior == "bhvFadingWarp":
+                    fading_warps.append(((*area, param), position))
+                elif behavior == "bhvStar":
+                    x, y, z = position
+                    stars.append((area, Point3D(x, y - STAR_HEIGHT_ABOVE_PLATFORM, z)))
+        if mario_pos is None:
+            raise RuntimeError("The level has no MARIO_POS().")
+
+        platforms: List[Platform] = []
+        doors = 0
+        for area, boxes in diamonds.items():
+            for box, positions in sorted(boxes.items()):
+                # The close diamond is the higher one.
+                x, y, z = max(positions, key=lambda position: position.y)
+                door = DoorInLevel(
+                    Point3D(
+                        x - DoorInLevel.gap_size_between_platforms,
+                        y
+                        - DoorInLevel.height_difference_between_platforms
+                        - DoorInLevel.diamond_height_above_platform,
+                        z,
+                    ),
+                    name=f"{area[0]} area {area[1]} water box {box}",
+                )
+                for entrance in DoorEntrance:
+                    platforms.append(
+                        Platform(
+                            area,
+                            door.get_platform_center(entrance),
+                            1 << doors,
+                            entrance,
+                        )
+                    )
+                doors += 1
+        start = len(platforms)
+        platforms.append(Platform(*mario_pos))
+
+        def find_platform(area: AreaKey, position: Point3D) -> Optional[int]:
+            radius = DoorInLevel.platform_half_side_length
+            for index, platform in enumerate(platforms):
+                x, y, z = platform.center
+                if (
+                    platform.area == area
+                    and y == position.y
+                    and abs(x - position.x) <= radius
+                    and abs(z - position.z) <= radius
+                ):
+                    return index
+            return None
+
+        warps: Dict[NodeKey, Tuple[int, NodeKey]] = {}
+        for node, position in sorted(fading_warps):
+            index = find_platform(node[:2], position)
+            if index is None:
+                raise RuntimeError(f"Warp {node} at {position} is on no platform.")
+            if node not in warp_nodes:
+                raise RuntimeError(f"Warp {node} has no WARP_NODE().")
+            platforms[index].nodes.append(node[2])
+            warps[node] = (index, warp_nodes[node])
+        for node, dest in warp_nodes.items():
+            if dest not in warps:
+                raise RuntimeError(
+                    f"Warp node {node} leads to {dest}, which is no warp."
+                )
+        for area, position in stars:
+            index = find_platform(area, position)
+            if index is None:
+                raise RuntimeError(f"The star at {position} is above no platform.")
+            platforms[index].star = True
+        return cls(platforms, warps, start, doors)
+
+    def is_choice(self, index: int) -> bool:
+        return index == self.start or len(self.platforms[index].nodes) > 1
+
+
+@dataclass
+class LevelSegment:
+    """
+    The forced warps from a choice to the next choice platform (or the star),
+    reduced to their effect on the door states, as in strategy.Segment. A
+    target of None is the star.
+    """
+
+    need: int
+    opened: int
+    closed: int
+    target: Optional[int]
+    warps: int
+
+
+def compile_segment(level: RenderedLevel, node: NodeKey) -> Optional[LevelSegment]:
+    """
+    Follow the warps from `node` until a platform with a choice or the star.
+    Return None if that can never be done, i.e. it lands on a flooded
+    platform it flooded itself or on a platform without warps.
+    """
+    need = opened = closed = 0
+    warps = 0
+    while warps <= len(level.platforms):
+        index = level.warps[level.warps[node][1]][0]
+        platform = level.platforms[index]
+        if platform.entrance == DoorEntrance.OPEN:
+            opened |= platform.door
+            closed &= ~platform.door
+        elif platform.entrance == DoorEntrance.CLOSE:
+            closed |= platform.door
+            opened &= ~platform.door
+        elif platform.entrance == DoorEntrance.TRAVERSE:
+            if closed & platform.door:
+                return None
+            if not opened & platform.door:
+                need |= platform.door
+        warps += 1
+
+        if platform.star:
+            return LevelSegment(need, opened, closed, None, warps)
+        if level.is_choice(index):
+            return LevelSegment(need, opened, closed, index, warps)
+        if not platform.nodes:
+            return None
+        node = (*platform.area, platform.nodes[0])
+    return None
+
+
+@dataclass
+class WarpTable:
+    """
+    Every choice platform reachable from the start, with the forced warps
+    behind each of its fading warps compiled into a LevelSegment. Door states
+    are ints with a bit set for every door whose water is low, i.e. whose
+    TRAVERSE platform can be stood on; landing on the OPEN and CLOSE platforms
+    touches the diamond that sets and clears it.
+    """
+
+    start: int
+    segments: Dict[int, List[Optional[LevelSegment]]]
+
+    @classmethod
+    def from_level(cls, level: RenderedLevel) -> WarpTable:
+        segments: Dict[int, List[Optional[LevelSegment]]] = {}
+        pending = [level.start]
+        while pending:
+            index = pending.pop()
+            if index in segments:
+                continue
+            platform = level.platforms[index]
+            segments[index] = [
+                compile_segment(level, (*platform.area, node))
+                for node in platform.nodes
+            ]
+            for segment in segments[index]:
+                if segment and segment.target is not None:
+                    pending.append(segment.target)
+        return cls(level.start, segments)
+
+    def take(self, choice: int, index: int, doors: int) -> Optional[LevelSegment]:
+        # The segment behind a warp, or None if it's flooded (or never passable).
+        segment = self.segments[choice][index]
+        if segment is None or doors & segment.need != segment.need:
+            return None
+        return segment
+
+
+@dataclass
+class WalkStats:
+    walks: int = 0
+    # Walks that reached the star.
+    wins: int = 0
+    # Warps taken.
+    traversals: int = 0
+    seconds: float = 0.0
+
+    @property
+    def traversals_per_second(self) -> float:
+        return self.traversals / self.seconds if self.seconds else 0.0
+
+
+def read_strategy(path: Path) -> List[Tuple[str, int]]:
+    # The (choice gadget, exit index) lines of a file from write_strategy().
+    # Universal branch lines follow from the choices, so they're skipped.
+    choices: List[Tuple[str, int]] = []
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or line.startswith("forall "):
+            continue
+        name, index = line.rsplit(" ", 1)
+        choices.append((name, int(index)))
+    return choices
+
+
+def replay(table: WarpTable, choices: List[Tuple[str, int]]) -> int:
+    """
+    Make the given choices from the start, and return the number of warps
+    taken. Each choice takes the fading warp of that index on the current
+    choice platform; the level doesn't know the gadget names, so they're only
+    reported. Raise a RuntimeError unless the choices reach the star.
+    """
+    choice = table.start
+    doors = 0
+    traversals = 0
+    for step, (name, index) in enumerate(choices):
+        if index >= len(table.segments[choice]):
+            raise RuntimeError(
+                f"Choice {step} of the strategy takes exit {index} of {name}, but "
+                f"its platform only has {len(table.segments[choice])} warps."
+            )
+        segment = table.take(choice, index, doors)
+        if segment is None:
+            raise RuntimeError(
+                f"Choice {step} of the strategy takes exit {index} of {name}, "
+                "which is flooded."
+            )
+        doors = (doors & ~segment.closed) | segment.opened
+        traversals += segment.warps
+        if segment.target is None:
+            if step != len(choices) - 1:
+                raise RuntimeError(
+                    f"The strategy reaches the star after choice {step}."
+                )
+            return traversals
+        choice = segment.target
+    raise RuntimeError("The strategy stops short of the star.")
+
+
+def random_walks(
+    table: WarpTable, walks: int, max_choices: int, rng: random.Random
+) -> WalkStats:
+    """
+    Walk from the start, taking a random passable warp on every choice
+    platform, until reaching the star, getting stuck or making `max_choices`
+    choices.
+    """
+    stats = WalkStats()
+    start = time.perf_counter()
+    for _ in range(walks):
+        choice = table.start
+        doors = 0
+        for _ in range(max_choices):
+            passable = [
+                segment
+                for index in range(len(table.segments[choice]))
+                for segment in [table.take(choice, index, doors)]
+                if segment is not None
+            ]
+            if not passable:
+                break
+            segment = rng.choice(passable)
+            doors = (doors & ~segment.closed) | segment.opened
+            stats.traversals += segment.warps
+            if segment.target is None:
+                stats.wins += 1
+                break
+            choice = segment.target
+        stats.walks += 1
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def can_reach_star(table: WarpTable) -> bool:
+    # Search every (choice platform, door states) state reachable from the start.
+    visited: Set[Tuple[int, int]] = {(table.start, 0)}
+    pending = [(table.start, 0)]
+    while pending:
+        choice, doors = pending.pop()
+        for index in range(len(table.segments[choice])):
+            segment = table.take(choice, index, doors)
+            if segment is None:
+                continue
+            if segment.target is None:
+                return True
+            state = (segment.target, (doors & ~segment.closed) | segment.opened)
+            if state not in visited:
+                visited.add(state)
+                pending.append(state)
+    return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Play through the level generated for a formula without an emulator: "
+            "read its platforms and warps back from the generated script.inc.c, "
+            "then replay a strategy or take random walks, tracking which doors are "
+            "flooded. Fails if a false formula's star can be reached."
+        )
+    )
+    parser.add_argument(
+        "quantifiers",
+        nargs="?",
+        type=int,
+        help="The number of alternating quantifiers, as for main.py.",
+    )
+    parser.add_argument(
+        "formula",
+        help="The 3-CNF formula the level was generated from, as for main.py.",
+    )
+    parser.add_argument(
+        "--level_subdir",
+        type=Path,
+        help=(
+            "Play the level that main.py already generated into this directory, "
+            "from the same formula. If unspecified, the level is generated into a "
+            "temporary directory first."
+        ),
+    )
+    parser.add_argument(
+        "--walks", default=1000, type=int, help="How many random walks to take."
+    )
+    parser.add_argument(
+        "--max_choices",
+        default=1000,
+        type=int,
+        help="Give up on a random walk after this many choices.",
+    )
+    parser.add_argument(
+        "--seed", default=0, type=int, help="Seed the random walks with this."
+    )
+    parser.add_argument(
+        "--strategy",
+        type=Path,
+        help="Replay this strategy file (see main.py --strategy) instead.",
+    )
+    parser.add_argument(
+        "--exhaustive",
+        action="store_true",
+        help=(
+            "Also search every reachable door state for a way to the star, and "
+            "fail unless there is one exactly when the formula is true. Random "
+            "walks alone can't show that there is none, but this takes "
+            "exponential time."
+        ),
+    )
+    args = parser.parse_args()
+
+    formula_3cnf = get_3cnf_from_formula(args.formula)
+    report = verify_formula(formula_3cnf, args.quantifiers)
+    qbf = QBF(report.variables, formula_3cnf)
+    if args.level_subdir:
+        script = (args.level_subdir / "script.inc.c").read_text()
+    else:
+        with tempfile.TemporaryDirectory() as level_subdir:
+            translate_to_level(qbf, Path(level_subdir))
+            script = (Path(level_subdir) / "script.inc.c").read_text()
+    level = RenderedLevel.from_scripts([script])
+    table = WarpTable.from_level(level)
+    value = solve_qbf(qbf)
+    print(f"The formula is {str(value).lower()}.")
+
+    if args.strategy:
+        start = time.perf_counter()
+        traversals = replay(table, read_strategy(args.strategy))
+        seconds = time.perf_counter() - start
+        print(f"Replayed {args.strategy}: reached the star in {traversals} warps.")
+        if not value:
+            raise RuntimeError("A strategy reached the star of a false formula.")
+    else:
+        stats = random_walks(
+            table, args.walks, args.max_choices, random.Random(args.seed)
+        )
+        traversals, seconds = stats.traversals, stats.seconds
+        print(f"{stats.wins} of {stats.walks} random walks reached the star.")
+        if stats.wins and not value:
+            raise RuntimeError("A random walk reached the star of a false formula.")
+
+    if args.exhaustive and can_reach_star(table) != value:
+        raise RuntimeError(
+            f"The level disagrees with the solver: the formula is "
+            f"{str(value).lower()}, but the star is "
+            f"{'un' if value else ''}reachable."
+        )
+    print(
+        f"{len(table.segments)} choice platforms, {level.doors} doors, "
+        f"{traversals} warps in {seconds:.3f} s "
+        f"({traversals / seconds if seconds else 0:.0f} warps/s)."
+    )
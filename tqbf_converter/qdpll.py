@@ -0,0 +1,167 @@
+#! /usr/bin/env python3.8
+from __future__ import annotations
+
+from typing import Dict, List, Set
+
+from parse_qbf import QBF
+
+
+def is_existential(literal: int) -> bool:
+    # Quantifiers alternate, starting with EXISTS(), in variable order.
+    return abs(literal) % 2 == 1
+
+
+class QDPLLSolver:
+    """
+    A QDPLL solver for a QBF in prenex normal form: DPLL-style search that
+    branches on variables in quantifier order, with unit propagation on
+    existential literals over two watched literals per clause, universal
+    reduction and the pure literal rule.
+
+    Clause learning is not done: learning in QBF needs Q-resolution with
+    universal reduction, which isn't worth the complexity at the formula sizes
+    that still fit into a level.
+    """
+
+    def __init__(self, qbf: QBF):
+        self.variables = qbf.variables
+        # 1 for true, -1 for false and 0 for unassigned, indexed by variable.
+        self.values: List[int] = [0] * (qbf.variables + 1)
+        self.trail: List[int] = []
+        self.propagated = 0
+        self.clauses: List[List[int]] = []
+        self.watches: Dict[int, List[int]] = {
+            literal: []
+            for variable in range(1, qbf.variables + 1)
+            for literal in (variable, -variable)
+        }
+        self.trivially_false = False
+
+        for clause in qbf.formula.clauses:
+            literals = sorted(set(clause), key=abs)
+            if any(-literal in literals for literal in literals):
+                # Tautologies are always satisfied.
+                continue
+            literals = self.reduce_universals(literals)
+            if not literals:
+                self.trivially_false = True
+            elif len(literals) == 1:
+                if self.value(literals[0]) < 0:
+                    self.trivially_false = True
+                elif self.value(literals[0]) == 0:
+                    self.assign(literals[0])
+            else:
+                self.watches[literals[0]].append(len(self.clauses))
+                self.watches[literals[1]].append(len(self.clauses))
+                self.clauses.append(literals)
+
+    @staticmethod
+    def reduce_universals(literals: List[int]) -> List[int]:
+        # Universal reduction: a universal literal quantified after every
+        # existential literal in its clause can be dropped, since the universal
+        # player would always pick it to be false.
+        last_existential = max(
+            (abs(literal) for literal in literals if is_existential(literal)),
+            default=0,
+        )
+        return [
+            literal
+            for literal in literals
+            if is_existential(literal) or abs(literal) < last_existential
+        ]
+
+    def value(self, literal: int) -> int:
+        value = self.values[abs(literal)]
+        return value if literal > 0 else -value
+
+    def assign(self, literal: int) -> None:
+        self.values[abs(literal)] = 1 if literal > 0 else -1
+        self.trail.append(literal)
+
+    def backtrack(self, trail_length: int) -> None:
+        while len(self.trail) > trail_length:
+            self.values[abs(self.trail.pop())] = 0
+        self.propagated = min(self.propagated, trail_length)
+
+    def propagate(self) -> bool:
+        """
+        Propagate the assignments on the trail. Return False on a conflict,
+        i.e. a clause that has become false, or whose only remaining literals
+        are universal.
+        """
+        while self.propagated < len(self.trail):
+            false_literal = -self.trail[self.propagated]
+            self.propagated += 1
+            watchers = self.watches[false_literal]
+            i = 0
+            while i < len(watchers):
+                clause = self.clauses[watchers[i]]
+                if clause[0] == false_literal:
+                    clause[0], clause[1] = clause[1], clause[0]
+                other = clause[0]
+                if self.value(other) > 0:
+                    i += 1
+                    continue
+
+                for k in range(2, len(clause)):
+                    if self.value(clause[k]) >= 0:
+                        clause[1], clause[k] = clause[k], clause[1]
+                        self.watches[clause[1]].append(watchers[i])
+                        watchers[i] = watchers[-1]
+                        watchers.pop()
+                        break
+                else:
+                    if self.value(other) < 0 or not is_existential(other):
+                        return False
+                    self.assign(other)
+                    i += 1
+        return True
+
+    def open_literals(self) -> Set[int]:
+        # The unassigned literals of the clauses that aren't satisfied yet.
+        # Other variables can't change the outcome any more.
+        literals: Set[int] = set()
+        for clause in self.clauses:
+            if all(self.value(literal) <= 0 for literal in clause):
+                literals.update(
+                    literal for literal in clause if not self.value(literal)
+                )
+        return literals
+
+    def search(self) -> bool:
+        while True:
+            if not self.propagate():
+                return False
+            literals = self.open_literals()
+            if not literals:
+                return True
+            # Pure literals: an existential one can safely be made true, and a
+            # universal one would always be made false.
+            pure = [literal for literal in literals if -literal not in literals]
+            if not pure:
+                break
+            for literal in pure:
+                self.assign(literal if is_existential(literal) else -literal)
+
+        # Branch on the outermost variable that still matters.
+        variable = min(abs(literal) for literal in literals)
+        existential = is_existential(variable)
+        for literal in (variable, -variable):
+            trail_length = len(self.trail)
+            self.assign(literal)
+            result = self.search()
+            self.backtrack(trail_length)
+            if result == existential:
+                # An existential needs one branch to be true; a universal
+                # needs one branch to be false.
+                return result
+        return not existential
+
+    def solve(self) -> bool:
+        if self.trivially_false:
+            return False
+        return self.search()
+
+
+def solve_qbf(qbf: QBF) -> bool:
+    return QDPLLSolver(qbf).solve()
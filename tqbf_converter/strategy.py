@@ -0,0 +1,208 @@
+#! /usr/bin/env python3.8
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from gadgets import (
+    ChoiceGadget,
+    DoorEntrance,
+    DoorPath,
+    EndGadget,
+    StartGadget,
+    UniversalGadget,
+)
+
+Target = Union[ChoiceGadget, EndGadget]
+
+
+@dataclass
+class DoorStateEncoding:
+    """
+    Assigns a bit to every door reachable from the start gadget, so that which
+    doors are open can be stored as a single int. All doors start out closed.
+    """
+
+    # Keyed by id(), since DoorGadget isn't hashable.
+    masks: Dict[int, int]
+
+    @classmethod
+    def from_start(cls, start_gadget: StartGadget) -> DoorStateEncoding:
+        masks: Dict[int, int] = {}
+        seen_choices: Set[int] = set()
+        pending: List[Union[ChoiceGadget, DoorPath]] = [start_gadget.path_to]
+        while pending:
+            item = pending.pop()
+            if isinstance(item, ChoiceGadget):
+                if id(item) not in seen_choices:
+                    seen_choices.add(id(item))
+                    pending.extend(reversed(item.choices))
+                continue
+            door = item[0]
+            if id(door) in masks:
+                continue
+            masks[id(door)] = 1 << len(masks)
+            for entrance in DoorEntrance:
+                next_gadget = door.path_exits.get(entrance)
+                if next_gadget is not None and not isinstance(next_gadget, EndGadget):
+                    pending.append(next_gadget)
+                    pending.append((door, entrance))
+        return cls(masks)
+
+    def __len__(self) -> int:
+        return len(self.masks)
+
+
+@dataclass
+class Move:
+    choice: ChoiceGadget
+    index: int
+    # The door entrances passed through after making the choice, up to the next
+    # choice gadget (or the end). They follow from the choice, so they're not
+    # part of the compact strategy format.
+    steps: List[DoorPath]
+
+
+@dataclass
+class Segment:
+    """
+    The forced path from a choice to the next choice gadget (or the end),
+    reduced to its effect on the door states: it can be taken if all doors in
+    `need` are open, and then opens `opened` and closes `closed`.
+    """
+
+    need: int
+    opened: int
+    closed: int
+    target: Target
+    steps: List[DoorPath]
+
+
+def compile_segment(
+    encoding: DoorStateEncoding, door_path: DoorPath
+) -> Optional[Segment]:
+    """
+    Follow the forced path from `door_path`. Return None if it can never be
+    taken, i.e. it traverses a door it closed itself or runs into a dead end.
+    """
+    need = opened = closed = 0
+    steps: List[DoorPath] = []
+    # A forced path can't usefully pass through more entrances than exist.
+    max_steps = len(encoding) * len(DoorEntrance)
+    while len(steps) <= max_steps:
+        door, entrance = door_path
+        mask = encoding.masks[id(door)]
+        if entrance == DoorEntrance.OPEN:
+            opened |= mask
+            closed &= ~mask
+        elif entrance == DoorEntrance.CLOSE:
+            closed |= mask
+            opened &= ~mask
+        elif closed & mask:
+            return None
+        elif not opened & mask:
+            need |= mask
+        steps.append(door_path)
+
+        next_gadget = door.path_exits.get(entrance)
+        if next_gadget is None:
+            return None
+        if isinstance(next_gadget, (ChoiceGadget, EndGadget)):
+            return Segment(need, opened, closed, next_gadget, steps)
+        door_path = next_gadget
+    return None
+
+
+def find_winning_path(start_gadget: StartGadget) -> Optional[List[Move]]:
+    """
+    Search the gadget graph for a sequence of choices that reaches the end
+    gadget, or return None if there is none (i.e. the formula is false).
+
+    States are (choice gadget, open doors), and every state is expanded at most
+    once. The universal gadgets need no special handling: their doors force
+    any path to the end to cover both values of their variable.
+    """
+    encoding = DoorStateEncoding.from_start(start_gadget)
+    segments: Dict[int, List[Optional[Segment]]] = {}
+
+    start = start_gadget.path_to
+    visited: Set[Tuple[int, int]] = {(id(start), 0)}
+    # Each entry is a state and the index of the next choice to try from it.
+    # `moves` holds the choices leading to the top of the stack.
+    stack: List[Tuple[ChoiceGadget, int, int]] = [(start, 0, 0)]
+    moves: List[Move] = []
+    while stack:
+        choice, doors, index = stack[-1]
+        if index == len(choice.choices):
+            stack.pop()
+            if stack:
+                moves.pop()
+            continue
+        stack[-1] = (choice, doors, index + 1)
+
+        if id(choice) not in segments:
+            segments[id(choice)] = [
+                compile_segment(encoding, door_path) for door_path in choice.choices
+            ]
+        segment = segments[id(choice)][index]
+        if segment is None or doors & segment.need != segment.need:
+            continue
+        if isinstance(segment.target, EndGadget):
+            return moves + [Move(choice, index, segment.steps)]
+        next_doors = (doors & ~segment.closed) | segment.opened
+        if (id(segment.target), next_doors) in visited:
+            continue
+        visited.add((id(segment.target), next_doors))
+        moves.append(Move(choice, index, segment.steps))
+        stack.append((segment.target, next_doors, 0))
+    return None
+
+
+def format_strategy(moves: List[Move]) -> List[str]:
+    """
+    Format a winning path as a strategy tree: one line per choice, giving the
+    choice gadget and the index of the exit to take. Each universal variable
+    has a branch per value; the choices made in a branch are indented below it.
+    """
+    # (id(door), entrance) -> (variable, value), where a value of None means
+    # the path leaves the universal gadget after covering both branches.
+    branch_entrances: Dict[Tuple[int, DoorEntrance], Tuple[int, Optional[bool]]] = {}
+    for universal in UniversalGadget.get_instances():
+        branch_entrances[(id(universal.door_d), DoorEntrance.CLOSE)] = (
+            universal.variable,
+            True,
+        )
+        branch_entrances[(id(universal.door_b), DoorEntrance.OPEN)] = (
+            universal.variable,
+            False,
+        )
+        branch_entrances[(id(universal.door_d), DoorEntrance.TRAVERSE)] = (
+            universal.variable,
+            None,
+        )
+
+    lines: List[str] = []
+    branches: List[int] = []
+    for move in moves:
+        lines.append(f"{'  ' * len(branches)}{move.choice.name} {move.index}")
+        for door, entrance in move.steps:
+            branch = branch_entrances.get((id(door), entrance))
+            if branch is None:
+                continue
+            variable, value = branch
+            if variable in branches:
+                del branches[branches.index(variable) :]
+            if value is not None:
+                lines.append(
+                    f"{'  ' * len(branches)}forall {variable} = {str(value).lower()}"
+                )
+                branches.append(variable)
+    return lines
+
+
+def write_strategy(moves: List[Move], path: Path) -> None:
+    with path.open("w") as f:
+        f.write("# <choice gadget> <index of the exit to take>\n")
+        for line in format_strategy(moves):
+            f.write(line + "\n")
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import pytest
+
+from budget import (
+    WARP_NODE_BYTES,
+    BudgetLimits,
+    StructureCounts,
+    check_budget,
+    count_script_structures,
+)
+from main import translate_to_level
+from parse_qbf import QBF, get_3cnf_from_formula, verify_formula
+
+
+def build_level(formula: str, level_subdir: Path, **kwargs) -> None:
+    formula_3cnf = get_3cnf_from_formula(formula)
+    report = verify_formula(formula_3cnf, None)
+    translate_to_level(QBF(report.variables, formula_3cnf), level_subdir, **kwargs)
+
+
+def test_count_script_structures():
+    script = [
+        "    AREA(1, castle_grounds_area_1_level),\n",
+        "        OBJECT(0x38, 0, 0, 0, 0, 0, 0, 0x00000000, bhvWaterLevelDiamond),\n"
+        "        WARP_NODE(/*id*/ 0x00, /*destLevel*/ LEVEL_CASTLE_GROUNDS, ",
+        "/*destArea*/ 0x01, /*destNode*/ 0x00, /*flags*/ WARP_NO_CHECKPOINT),\n",
+        "    END_AREA(),\n",
+    ]
+    counts = count_script_structures(script)
+    assert counts[1].objects == 1
+    assert counts[1].warp_nodes == 1
+
+
+def test_generated_warps_are_counted(tmp_path):
+    build_level("1,2,3;-1,-2,3", tmp_path)
+    counts = count_script_structures([(tmp_path / "script.inc.c").read_text()])
+    assert counts
+    for area in counts.values():
+        assert area.warp_nodes > 0
+        assert area.script_bytes >= area.warp_nodes * WARP_NODE_BYTES
+
+
+def test_warp_nodes_over_limit():
+    areas = {1: StructureCounts(warp_nodes=5)}
+    with pytest.raises(ValueError, match="area 1 has 5 warp nodes"):
+        check_budget(areas, StructureCounts(), BudgetLimits(warp_nodes_per_area=4))
@@ -0,0 +1,55 @@
+import pytest
+
+from gadgets import (
+    DoorEntrance,
+    DoorGadget,
+    EndGadget,
+    create_and_hook_up_doors_clauses,
+    create_and_hook_up_quantifiers,
+)
+from parse_qbf import QBF, get_3cnf_from_formula
+from qdpll import solve_qbf
+from strategy import find_winning_path
+
+
+def build_gadgets(variables: int, formula: str):
+    clauses = get_3cnf_from_formula(formula).clauses
+    door_gadgets_literals, first_clause, last_clause = create_and_hook_up_doors_clauses(
+        clauses
+    )
+    start_gadget = create_and_hook_up_quantifiers(
+        variables, door_gadgets_literals, first_clause, last_clause
+    )
+    doors = {door.name: door for door in DoorGadget.get_instances()}
+    return start_gadget, doors, first_clause, last_clause
+
+
+@pytest.mark.parametrize("variables", [1, 3])
+def test_innermost_existential_leads_to_first_clause(variables):
+    formula = ";".join(f"{v},{v},-{v}" for v in range(1, variables + 1))
+    _, doors, first_clause, _ = build_gadgets(variables, formula)
+    for door in ("a", "b"):
+        exits = doors[f"existential_{variables}_{door}"].path_exits
+        assert exits[DoorEntrance.TRAVERSE] is first_clause
+
+
+def test_single_quantifier_clauses_lead_to_end():
+    _, _, _, last_clause = build_gadgets(1, "1,1,1")
+    for door, entrance in last_clause.choices:
+        assert isinstance(door.path_exits[entrance], EndGadget)
+
+
+@pytest.mark.parametrize(
+    "variables,formula",
+    [
+        (1, "1,1,1"),
+        (1, "1,1,1;-1,-1,-1"),
+        (2, "1,2,2;-1,-2,-2"),
+        (3, "1,2,3;-1,-2,3"),
+        (3, "1,2,3;-1,-2,-3;1,-2,3;-1,2,-3"),
+    ],
+)
+def test_winning_path_matches_solver(variables, formula):
+    start_gadget, _, _, _ = build_gadgets(variables, formula)
+    qbf = QBF(variables, get_3cnf_from_formula(formula))
+    assert (find_winning_path(start_gadget) is not None) == solve_qbf(qbf)
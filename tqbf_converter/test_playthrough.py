@@ -0,0 +1,34 @@
+import pytest
+
+from main import translate_to_level
+from parse_qbf import QBF, get_3cnf_from_formula
+from playthrough import RenderedLevel, WarpTable, can_reach_star
+from qdpll import solve_qbf
+
+
+def render_script(variables: int, formula: str, level_subdir) -> str:
+    qbf = QBF(variables, get_3cnf_from_formula(formula))
+    translate_to_level(qbf, level_subdir, doors_per_area=4)
+    return (level_subdir / "script.inc.c").read_text()
+
+
+@pytest.mark.parametrize(
+    "variables,formula",
+    [
+        (1, "1,1,1"),
+        (1, "1,1,1;-1,-1,-1"),
+        (2, "1,2,2;-1,-2,-2"),
+        (3, "1,2,3;-1,-2,-3;1,-2,3;-1,2,-3"),
+    ],
+)
+def test_star_reachable_iff_true(tmp_path, variables, formula):
+    level = RenderedLevel.from_scripts([render_script(variables, formula, tmp_path)])
+    qbf = QBF(variables, get_3cnf_from_formula(formula))
+    assert can_reach_star(WarpTable.from_level(level)) == solve_qbf(qbf)
+
+
+def test_missing_warp_node(tmp_path):
+    lines = render_script(1, "1,1,1", tmp_path).splitlines()
+    del lines[next(i for i, line in enumerate(lines) if "WARP_NODE" in line)]
+    with pytest.raises(RuntimeError, match="has no WARP_NODE"):
+        RenderedLevel.from_scripts(["\n".join(lines)])